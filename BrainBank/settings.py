@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 import os
 from pathlib import Path
+import tempfile
 from decouple import config
 import dj_database_url
 
@@ -53,6 +54,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'courses.middleware.PlayerProfileMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -91,6 +93,8 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # A temp file rather than memory, so concurrency tests can use several connections
+        'TEST': {'NAME': Path(tempfile.gettempdir()) / 'brainbank_test.sqlite3'},
     }
 }
 
@@ -114,13 +118,24 @@ CACHES = {
 
 # Cache settings for different environments
 if 'RAILWAY_ENVIRONMENT' in os.environ:
-    # Production: Use Redis if available, otherwise use database cache
+    # Production: Use Redis if available, otherwise use database cache.
+    # A short-lived per-process LRU sits in front of it to save round trips.
     CACHES = {
         'default': {
+            'BACKEND': 'courses.cache_backends.TwoTierCache',
+            'TIMEOUT': 300,
+            'OPTIONS': {
+                'SHARED_ALIAS': 'shared',
+                'LOCAL_TIMEOUT': 5,
+                'LOCAL_MAX_ENTRIES': 1000,
+                'STAMP_CHECK_INTERVAL': 1,
+            },
+        },
+        'shared': {
             'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
             'LOCATION': 'cache_table',
             'TIMEOUT': 300,
-        }
+        },
     }
 
 # Password validation
@@ -226,6 +241,9 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',
     ],
+    # Every list is cursor-paginated with a bounded page size
+    'DEFAULT_PAGINATION_CLASS': 'courses.pagination.StableCursorPagination',
+    'PAGE_SIZE': 50,
 }
 
 # Security settings for production
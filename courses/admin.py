@@ -1,6 +1,6 @@
 # courses/admin.py
 from django.contrib import admin
-from .models import Course, ShopItem, PlayerProfile, Purchase, Quiz, Question, Option
+from .models import Course, ShopItem, PlayerProfile, Purchase, Quiz, Question, Option, DeferredJob
 
 # Course admin with custom display
 class CourseAdmin(admin.ModelAdmin):
@@ -68,3 +68,11 @@ class OptionAdmin(admin.ModelAdmin):
     get_course.short_description = "Course"
 
 admin.site.register(Option, OptionAdmin)
+
+# Deferred job queue (read-mostly, for inspecting failures)
+class DeferredJobAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'player', 'course', 'activity_date', 'created_at', 'processed_at', 'failed_at', 'attempts', 'next_attempt_at')
+    list_filter = ('kind', 'processed_at', 'failed_at')
+    search_fields = ('player__user__username', 'course__title')
+
+admin.site.register(DeferredJob, DeferredJobAdmin)
@@ -0,0 +1,151 @@
+"""
+Quiz attempt state for the per-question and whole-quiz flows.
+
+Progress through a quiz (next question, running score) travels with the
+request as a signed, tamper-proof token instead of living in the session,
+so answering a question writes nothing to the database. Each token is bound
+to one user, one quiz and that quiz's content version, so attempts in
+parallel tabs never share a score. Only finishing an attempt is recorded,
+as a FinishedAttempt row, which makes every attempt's points claimable once.
+"""
+from datetime import timedelta
+from django.core import signing
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+import logging
+import time
+
+from .models import FinishedAttempt
+
+logger = logging.getLogger(__name__)
+
+ATTEMPT_SALT = 'courses.quiz_attempt'
+
+# How long an attempt stays valid, in seconds, counted from its start
+ATTEMPT_MAX_AGE = 60 * 60 * 6
+
+
+def start_attempt(user, quiz):
+    """
+    Begin a new attempt at a quiz.
+
+    Args:
+        user: User taking the quiz
+        quiz: CompiledQuiz being attempted
+
+    Returns:
+        (token, state) for the first question
+    """
+    state = {
+        'id': get_random_string(16),
+        'user': user.pk,
+        'quiz': quiz.id,
+        'version': quiz.version,
+        'next': 1,
+        'score': 0,
+        # Re-signing on every answer renews the token's own timestamp, so
+        # the attempt's age is checked against its start instead
+        'started': int(time.time()),
+    }
+    return _sign(state), state
+
+
+def load_attempt(token, user, quiz):
+    """
+    Verify an attempt token and return its state.
+
+    Args:
+        token: Token from the quiz form or URL
+        user: User making the request
+        quiz: CompiledQuiz the request is for
+
+    Returns:
+        State dict, or None if the token is missing or forged, the attempt
+        started more than ATTEMPT_MAX_AGE ago, or it belongs to another
+        user, quiz or version of the quiz
+    """
+    if not token:
+        return None
+    try:
+        state = signing.loads(token, salt=ATTEMPT_SALT, max_age=ATTEMPT_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    if (state.get('user') != user.pk or state.get('quiz') != quiz.id
+            or state.get('version') != quiz.version):
+        return None
+    # Expired before prune_finished_attempts() can drop its claim, so a
+    # finished attempt can never be replayed
+    if time.time() - state.get('started', 0) > ATTEMPT_MAX_AGE:
+        return None
+    return state
+
+
+def advance_attempt(state, correct):
+    """
+    Record the answer to the current question.
+
+    Args:
+        state: State from load_attempt()
+        correct: Whether the answer was correct
+
+    Returns:
+        (token, state) for the following question
+    """
+    state = dict(state, next=state['next'] + 1, score=state['score'] + int(bool(correct)))
+    return _sign(state), state
+
+
+def finish_attempt(state):
+    """
+    Mark an attempt finished so its points are awarded only once.
+
+    The claim is a row with a unique attempt id. Call this inside the
+    transaction that awards the points, so the claim and the points
+    commit or roll back together.
+
+    Returns:
+        True the first time an attempt is finished, False for repeats
+    """
+    try:
+        with transaction.atomic():
+            FinishedAttempt.objects.create(
+                attempt_id=state['id'], user_id=state['user'], quiz_id=state['quiz']
+            )
+    except IntegrityError:
+        logger.info(f"Ignoring repeated completion of quiz attempt {state['id']}")
+        return False
+    return True
+
+
+def result_token(state, result):
+    """
+    Token for the result page of a finished attempt.
+
+    The whole-quiz form redirects here after a successful POST, so
+    reloading the result page shows the result again without resubmitting.
+
+    Args:
+        state: State of the finished attempt
+        result: Dict with the attempt's score and gained_points
+
+    Returns:
+        Token that load_attempt() accepts, with the result under ``'result'``
+    """
+    return _sign(dict(state, result=result))
+
+
+def prune_finished_attempts():
+    """
+    Delete claims for attempts whose tokens have expired and cannot be replayed.
+
+    Returns:
+        Number of rows deleted
+    """
+    cutoff = timezone.now() - timedelta(seconds=ATTEMPT_MAX_AGE)
+    deleted, _ = FinishedAttempt.objects.filter(finished_at__lt=cutoff).delete()
+    return deleted
+
+
+def _sign(state):
+    return signing.dumps(state, salt=ATTEMPT_SALT, compress=True)
@@ -0,0 +1,230 @@
+"""
+Two-tier cache backend for the courses app.
+
+Puts a small, bounded, per-process LRU in front of a shared cache backend
+(the DatabaseCache in production), so repeated reads of hot keys such as
+the leaderboard page are served from memory instead of costing a SQL round
+trip each time.
+
+Local copies live for a few seconds only, so a delete made by one process
+reaches the others within ``LOCAL_TIMEOUT``. Clears also bump a shared
+version stamp that every process checks at most once per
+``STAMP_CHECK_INTERVAL``, so a full flush empties every worker's LRU.
+
+Keys starting with one of ``SHORT_LIVED_PREFIXES`` are kept locally for
+at most ``STAMP_CHECK_INTERVAL``. By default these are the cache generation
+keys (``gen:*``), so a bumped generation reaches every process within about
+a second, while warm reads of versioned keys still skip the shared tier.
+
+Configuration::
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'courses.cache_backends.TwoTierCache',
+            'OPTIONS': {
+                'SHARED_ALIAS': 'shared',   # alias of the shared backend
+                'LOCAL_TIMEOUT': 5,         # seconds a local copy is trusted
+                'LOCAL_MAX_ENTRIES': 1000,  # LRU bound per process
+                'STAMP_CHECK_INTERVAL': 1,  # seconds between stamp checks
+                'SHORT_LIVED_PREFIXES': ('gen:',),  # kept locally for STAMP_CHECK_INTERVAL
+            },
+        },
+        'shared': {...},
+    }
+"""
+from collections import OrderedDict
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+import pickle
+import threading
+import time
+
+# Shared key whose value changes whenever any process clears the cache
+STAMP_KEY = 'two_tier:stamp'
+
+_MISSING = object()
+
+
+class TwoTierCache(BaseCache):
+    """Bounded, TTL-aware in-process LRU in front of a shared cache backend."""
+
+    def __init__(self, location, params):
+        options = dict(params.get('OPTIONS', {}))
+        self._shared_alias = options.pop('SHARED_ALIAS', 'shared')
+        self.local_timeout = options.pop('LOCAL_TIMEOUT', 5)
+        self.local_max_entries = options.pop('LOCAL_MAX_ENTRIES', 1000)
+        self.stamp_check_interval = options.pop('STAMP_CHECK_INTERVAL', 1)
+        self.short_lived_prefixes = tuple(options.pop('SHORT_LIVED_PREFIXES', ('gen:',)))
+        super().__init__(dict(params, OPTIONS=options))
+
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._stamp_checked_at = 0.0
+        self._stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0}
+
+    @property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    # Local tier
+
+    def _local_key(self, key, version):
+        return self.make_and_validate_key(key, version=version)
+
+    def _local_ttl(self, key, timeout):
+        """Seconds a local copy of ``key`` stored with ``timeout`` is trusted."""
+        ttl = self.local_timeout
+        if self.short_lived_prefixes and key.startswith(self.short_lived_prefixes):
+            ttl = min(ttl, self.stamp_check_interval)
+        if timeout is not DEFAULT_TIMEOUT and timeout is not None:
+            ttl = min(ttl, timeout)
+        return ttl
+
+    def _local_get(self, local_key):
+        with self._lock:
+            entry = self._local.get(local_key)
+            if entry is None:
+                return _MISSING
+            expires_at, pickled = entry
+            if expires_at <= time.monotonic():
+                del self._local[local_key]
+                return _MISSING
+            self._local.move_to_end(local_key)
+        return pickle.loads(pickled)
+
+    def _local_set(self, local_key, value, ttl):
+        if ttl <= 0:
+            self._local_delete(local_key)
+            return
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._local[local_key] = (time.monotonic() + ttl, pickled)
+            self._local.move_to_end(local_key)
+            while len(self._local) > self.local_max_entries:
+                self._local.popitem(last=False)
+
+    def _local_delete(self, local_key):
+        with self._lock:
+            self._local.pop(local_key, None)
+
+    def _check_stamp(self):
+        """Drop all local copies if another process invalidated since the last check."""
+        now = time.monotonic()
+        if now - self._stamp_checked_at < self.stamp_check_interval:
+            return
+        stamp = self.shared.get(STAMP_KEY)
+        with self._lock:
+            if stamp != self._stamp:
+                self._local.clear()
+                self._stamp = stamp
+            self._stamp_checked_at = now
+
+    def _bump_stamp(self):
+        self.shared.set(STAMP_KEY, time.time_ns(), None)
+
+    def _count(self, stat, amount=1):
+        with self._lock:
+            self._stats[stat] += amount
+
+    # Cache API
+
+    def get(self, key, default=None, version=None):
+        self._check_stamp()
+        local_key = self._local_key(key, version)
+        value = self._local_get(local_key)
+        if value is not _MISSING:
+            self._count('local_hits')
+            return value
+        value = self.shared.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            self._count('misses')
+            return default
+        self._count('shared_hits')
+        self._local_set(local_key, value, self._local_ttl(key, DEFAULT_TIMEOUT))
+        return value
+
+    def get_many(self, keys, version=None):
+        self._check_stamp()
+        found = {}
+        remote_keys = []
+        for key in keys:
+            value = self._local_get(self._local_key(key, version))
+            if value is _MISSING:
+                remote_keys.append(key)
+            else:
+                found[key] = value
+        self._count('local_hits', len(found))
+        if remote_keys:
+            remote = self.shared.get_many(remote_keys, version=version)
+            for key, value in remote.items():
+                self._local_set(self._local_key(key, version), value, self._local_ttl(key, DEFAULT_TIMEOUT))
+            found.update(remote)
+            self._count('shared_hits', len(remote))
+            self._count('misses', len(remote_keys) - len(remote))
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version=version)
+        self._local_set(self._local_key(key, version), value, self._local_ttl(key, timeout))
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout, version=version)
+        for key, value in data.items():
+            if key not in failed:
+                self._local_set(self._local_key(key, version), value, self._local_ttl(key, timeout))
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout, version=version)
+        if added:
+            self._local_set(self._local_key(key, version), value, self._local_ttl(key, timeout))
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self._local_delete(self._local_key(key, version))
+        # Only this key goes; other processes drop their copy within LOCAL_TIMEOUT
+        return self.shared.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        for key in keys:
+            self._local_delete(self._local_key(key, version))
+        self.shared.delete_many(keys, version=version)
+
+    def has_key(self, key, version=None):
+        self._check_stamp()
+        if self._local_get(self._local_key(key, version)) is not _MISSING:
+            return True
+        return self.shared.has_key(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        # Counters are kept in the shared tier; drop this process's stale copy
+        value = self.shared.incr(key, delta, version=version)
+        self._local_delete(self._local_key(key, version))
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+        self.shared.clear()
+        self._bump_stamp()
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
+
+    def stats(self):
+        """
+        Hit and miss counters for this process.
+
+        Returns:
+            Dict with local_hits, shared_hits, misses, local_entries and the
+            share of reads served without touching the shared backend
+        """
+        with self._lock:
+            stats = dict(self._stats, local_entries=len(self._local))
+        reads = stats['local_hits'] + stats['shared_hits'] + stats['misses']
+        stats['local_hit_ratio'] = round(stats['local_hits'] / reads, 3) if reads else 0.0
+        return stats
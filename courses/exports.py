@@ -0,0 +1,105 @@
+"""
+Streaming data exports for analytics.
+
+Rows are read with ``values()`` and ``.iterator(chunk_size=...)`` and
+written out one line at a time, so an export of any size holds only one
+chunk of rows in memory. Every export is ordered by id; pass the last id
+seen as ``since_id`` to pull only newer rows next time.
+"""
+from django.core.serializers.json import DjangoJSONEncoder
+import csv
+import json
+
+from .models import CompletedQuiz, LeaderboardEntry, Purchase
+
+# Rows fetched from the database per round trip
+EXPORT_CHUNK_SIZE = 2000
+
+EXPORT_FORMATS = ('ndjson', 'csv')
+
+# Export name -> (queryset, exported columns, timestamp field for ``since``)
+EXPORTS = {
+    'purchases': (
+        Purchase.objects.all(),
+        ('id', 'player_id', 'player__user__username', 'item_id', 'item__name', 'item__price', 'purchased_at'),
+        'purchased_at',
+    ),
+    'completions': (
+        CompletedQuiz.objects.all(),
+        ('id', 'player_id', 'player__user__username', 'course_id', 'course__title', 'completed_at'),
+        'completed_at',
+    ),
+    'leaderboard': (
+        LeaderboardEntry.objects.all(),
+        ('id', 'name', 'score'),
+        None,
+    ),
+}
+
+
+def export_rows(name, since_id=None, since=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Iterate over the rows of an export as dicts, oldest id first.
+
+    Args:
+        name: Export name, one of EXPORTS
+        since_id: Only rows with a larger id
+        since: Only rows with a later timestamp (datetime)
+        chunk_size: Rows fetched per database round trip
+
+    Returns:
+        (columns, iterator of row dicts)
+
+    Raises:
+        ValueError: For an unknown export, or ``since`` on an export
+            without a timestamp
+    """
+    if name not in EXPORTS:
+        raise ValueError(f"Unknown export '{name}'")
+    queryset, columns, timestamp_field = EXPORTS[name]
+    if since_id is not None:
+        queryset = queryset.filter(id__gt=since_id)
+    if since is not None:
+        if timestamp_field is None:
+            raise ValueError(f"The '{name}' export has no timestamp; use since_id")
+        queryset = queryset.filter(**{f'{timestamp_field}__gt': since})
+    rows = queryset.order_by('id').values(*columns).iterator(chunk_size=chunk_size)
+    return columns, rows
+
+
+class _Echo:
+    """File-like object whose write() returns the line, for streaming csv.writer output."""
+
+    def write(self, value):
+        return value
+
+
+def ndjson_lines(rows):
+    """One JSON object per line."""
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+
+def csv_lines(columns, rows):
+    """A header line, then one CSV line per row."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow([row[column] for column in columns])
+
+
+def render_export(export_format, columns, rows):
+    """
+    Lazily render export rows as text lines.
+
+    Args:
+        export_format: 'ndjson' or 'csv'
+        columns: Column names from export_rows()
+        rows: Row iterator from export_rows()
+
+    Returns:
+        Generator of lines
+    """
+    if export_format == 'csv':
+        return csv_lines(columns, rows)
+    return ndjson_lines(rows)
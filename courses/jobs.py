@@ -0,0 +1,126 @@
+"""
+Deferred side-effect queue for the courses app.
+
+Non-critical work triggered by a request (completion rows, streaks) is
+recorded as a DeferredJob row and applied
+later by ``manage.py process_deferred_jobs``, so the user-facing response
+only pays for a single insert.
+"""
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+import logging
+
+from .models import DeferredJob, PlayerProfile
+from .quizzes import record_quiz_completion
+
+logger = logging.getLogger(__name__)
+
+# Jobs that failed this many times are left for manual inspection
+MAX_ATTEMPTS = 5
+
+# Delay before the first retry of a failed job; doubled for each further retry
+RETRY_DELAY = timedelta(seconds=30)
+
+
+def enqueue_quiz_completion(player_profile, course):
+    """
+    Queue the side effects of a player finishing a course's quiz.
+
+    Enqueueing is idempotent: while a job for the same player and course is
+    still pending, further calls are ignored. Jobs that failed for good
+    do not count as pending.
+
+    Args:
+        player_profile: PlayerProfile that completed the quiz
+        course: Course whose quiz was completed
+    """
+    DeferredJob.objects.bulk_create(
+        [DeferredJob(
+            kind='quiz_completion',
+            player=player_profile,
+            course=course,
+            activity_date=timezone.localdate(),
+        )],
+        ignore_conflicts=True,
+    )
+
+
+def _run_quiz_completion(job):
+    # Points and the leaderboard were already updated by the request
+    notices = record_quiz_completion(job.player, job.course, today=job.activity_date)
+    if notices:
+        # Shown on the player's next page by PlayerProfileMiddleware
+        PlayerProfile.objects.filter(pk=job.player_id).update(
+            pending_notices=job.player.pending_notices + notices
+        )
+
+
+JOB_HANDLERS = {
+    'quiz_completion': _run_quiz_completion,
+}
+
+
+def process_pending_jobs(batch_size=100, skip_ids=None):
+    """
+    Apply one batch of pending jobs, oldest first.
+
+    Each job is claimed and applied in its own transaction, so a job's
+    effects and its processed marker commit together. A job another worker
+    already claimed is skipped, which makes concurrent workers safe. A job
+    that fails is retried after ``RETRY_DELAY``, doubled per attempt, so a
+    transient error does not use up all of its attempts at once.
+
+    Args:
+        batch_size: Maximum number of jobs to process
+        skip_ids: Optional set of job ids to leave alone; the ids of jobs
+            that fail in this batch are added to it
+
+    Returns:
+        (processed, failed) counts for the batch
+    """
+    now = timezone.now()
+    pending = (
+        DeferredJob.objects
+        .filter(processed_at__isnull=True, failed_at__isnull=True)
+        .filter(Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now))
+    )
+    if skip_ids:
+        pending = pending.exclude(pk__in=skip_ids)
+    jobs = list(
+        pending
+        .select_related('player__user', 'course')
+        .order_by('id')[:batch_size]
+    )
+    processed = failed = 0
+    for job in jobs:
+        try:
+            with transaction.atomic():
+                claimed = DeferredJob.objects.filter(
+                    pk=job.pk, processed_at__isnull=True
+                ).update(processed_at=timezone.now())
+                if not claimed:
+                    continue
+                # Reload and lock the profile, so the job starts from current
+                # values and concurrent point or item writes wait for it
+                job.player = PlayerProfile.objects.select_for_update().select_related('user').get(pk=job.player_id)
+                JOB_HANDLERS[job.kind](job)
+            processed += 1
+        except Exception as e:
+            failed += 1
+            if skip_ids is not None:
+                skip_ids.add(job.pk)
+            logger.error(f"Deferred job {job.pk} ({job.kind}) failed: {e}")
+            attempts = job.attempts + 1
+            failed_at = timezone.now()
+            # Out of retries: mark the job dead so it frees its pending slot
+            DeferredJob.objects.filter(pk=job.pk).update(
+                attempts=attempts,
+                last_error=str(e)[:1000],
+                next_attempt_at=failed_at + RETRY_DELAY * 2 ** (attempts - 1),
+                failed_at=failed_at if attempts >= MAX_ATTEMPTS else None,
+            )
+            if attempts >= MAX_ATTEMPTS:
+                logger.error(f"Deferred job {job.pk} ({job.kind}) gave up after {attempts} attempts")
+    return processed, failed
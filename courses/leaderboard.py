@@ -0,0 +1,373 @@
+"""
+Leaderboard maintenance for the courses app.
+
+Write paths push point changes here as they happen, so the leaderboard table
+is kept current incrementally and page views never rebuild it. A full
+reconciliation against PlayerProfile is an offline job
+(``manage.py sync_leaderboard``).
+"""
+from datetime import timedelta
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+import base64
+import json
+import logging
+
+from .models import CohortScore, LeaderboardEntry, ScoreBucket
+
+logger = logging.getLogger(__name__)
+
+# Default and maximum number of entries on one leaderboard page
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
+# Periods that earned points are rolled up into
+WINDOW_PERIODS = ('day', 'week', 'month')
+
+
+def record_points_change(player_profile, delta, course=None):
+    """
+    Apply a point delta to a player's leaderboard entry.
+
+    The common case is a single ``UPDATE ... SET score = score + delta``.
+    If the player has no entry yet, one is seeded from the profile's
+    current points, which already include the delta. Points earned
+    (positive deltas) are also rolled into the player's day, week and
+    month buckets for the time-windowed leaderboards, and into the
+    course and level cohorts when a course is given.
+
+    Args:
+        player_profile: PlayerProfile whose points changed (already saved)
+        delta: Signed number of points gained or spent
+        course: Course the points were earned in, if any
+    """
+    if not delta:
+        return
+    if delta > 0:
+        _record_points_earned(player_profile, delta, course)
+    username = player_profile.user.username
+    updated = LeaderboardEntry.objects.filter(name=username).update(score=F('score') + delta)
+    if not updated:
+        set_player_score(username, player_profile.points)
+    elif delta < 0:
+        LeaderboardEntry.objects.filter(name=username, score__lte=0).delete()
+
+
+def set_player_score(username, points):
+    """
+    Set a player's leaderboard score to an absolute value.
+
+    Players without points are kept off the leaderboard.
+
+    Args:
+        username: Username the entry is keyed on
+        points: Player's current point balance
+    """
+    if points <= 0:
+        LeaderboardEntry.objects.filter(name=username).delete()
+        return
+    updated = LeaderboardEntry.objects.filter(name=username).update(score=points)
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            LeaderboardEntry.objects.create(name=username, score=points)
+    except IntegrityError:
+        # A concurrent request created the entry first
+        LeaderboardEntry.objects.filter(name=username).update(score=points)
+    logger.debug(f"Set leaderboard score for {username} to {points}")
+
+
+def _ranked_before(entry):
+    """Filter matching entries ranked above ``entry`` (higher score, then name)."""
+    return Q(score__gt=entry.score) | Q(score=entry.score, name__lt=entry.name)
+
+
+def _ranked_after(entry):
+    """Filter matching entries ranked below ``entry``."""
+    return Q(score__lt=entry.score) | Q(score=entry.score, name__gt=entry.name)
+
+
+def get_rank(username):
+    """
+    Get a player's 1-based leaderboard position.
+
+    Ranking is by score descending with ties broken by name, and the
+    position is computed with an indexed count of the entries ranked above
+    the player rather than by walking the table.
+
+    Args:
+        username: Username of the player
+
+    Returns:
+        Rank as an int, or None if the player is not on the leaderboard
+    """
+    entry = LeaderboardEntry.objects.filter(name=username).only('name', 'score').first()
+    if entry is None:
+        return None
+    return LeaderboardEntry.objects.filter(_ranked_before(entry)).count() + 1
+
+
+def get_neighbors(username, k=5):
+    """
+    Get the entries surrounding a player on the leaderboard.
+
+    Args:
+        username: Username of the player
+        k: Number of entries to include above and below the player
+
+    Returns:
+        List of LeaderboardEntry objects in rank order, each with a ``rank``
+        attribute, or an empty list if the player is not on the leaderboard
+    """
+    entry = LeaderboardEntry.objects.filter(name=username).first()
+    if entry is None:
+        return []
+    rank = LeaderboardEntry.objects.filter(_ranked_before(entry)).count() + 1
+    above = list(
+        LeaderboardEntry.objects.filter(_ranked_before(entry)).order_by('score', '-name')[:k]
+    )[::-1]
+    below = list(
+        LeaderboardEntry.objects.filter(_ranked_after(entry)).order_by('-score', 'name')[:k]
+    )
+    neighbors = above + [entry] + below
+    first_rank = rank - len(above)
+    for offset, neighbor in enumerate(neighbors):
+        neighbor.rank = first_rank + offset
+    return neighbors
+
+
+def encode_cursor(score, key, rank):
+    """
+    Encode a keyset position as an opaque page cursor.
+
+    The cursor carries the last row's score and tie-break key plus its rank,
+    so following pages can number their rows without a count query.
+    """
+    payload = json.dumps([score, key, rank], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, key_type=(int, str)):
+    """
+    Decode a cursor produced by encode_cursor().
+
+    Args:
+        cursor: Cursor string from a previous page
+        key_type: Type (or tuple of types) the tie-break key must have; a
+            cursor from a board with another tie-break counts as invalid
+
+    Returns:
+        (score, key, rank) tuple, or None if the cursor is missing or invalid
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        score, key, rank = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        return None
+    if any(isinstance(value, bool) for value in (score, key, rank)):
+        return None
+    if not isinstance(score, int) or not isinstance(key, key_type) or not isinstance(rank, int):
+        return None
+    return score, key, rank
+
+
+def clamp_page_size(limit):
+    """Coerce a requested page size into the 1..MAX_PAGE_SIZE range."""
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        return PAGE_SIZE
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def _keyset_page(queryset, tiebreak, cursor, limit, key_type):
+    """
+    Page a score table ordered by score descending, then ``tiebreak``.
+
+    Each page is a range scan on a score index starting after the cursor
+    position, so its cost depends on the page size, not on the table size
+    or how deep the page is. A cursor whose key is not a ``key_type`` (e.g.
+    one from another board) restarts at the top page.
+    """
+    limit = clamp_page_size(limit)
+    position = decode_cursor(cursor, key_type)
+    first_rank = 1
+    if position is not None:
+        score, key, rank = position
+        queryset = queryset.filter(
+            Q(score__lt=score) | Q(score=score, **{f'{tiebreak}__gt': key})
+        )
+        first_rank = rank + 1
+
+    # Fetch one extra row to learn whether a next page exists
+    rows = list(queryset.order_by('-score', tiebreak)[:limit + 1])
+    has_next = len(rows) > limit
+    rows = rows[:limit]
+    for offset, row in enumerate(rows):
+        row.rank = first_rank + offset
+    next_cursor = None
+    if has_next:
+        last = rows[-1]
+        next_cursor = encode_cursor(last.score, getattr(last, tiebreak), last.rank)
+    return rows, next_cursor
+
+
+def get_page(cursor=None, limit=PAGE_SIZE):
+    """
+    Get one page of the all-time leaderboard using keyset pagination.
+
+    Args:
+        cursor: Cursor from a previous page, or None for the top page
+        limit: Number of entries per page
+
+    Returns:
+        (entries, next_cursor) where entries carry a ``rank`` attribute and
+        next_cursor is None on the last page
+    """
+    return _keyset_page(LeaderboardEntry.objects.all(), 'name', cursor, limit, str)
+
+
+def period_start(period, day=None):
+    """
+    Get the first day of the day/week/month period containing ``day``.
+
+    Args:
+        period: One of 'day', 'week' or 'month'
+        day: Date inside the period (default: today)
+    """
+    day = day or timezone.localdate()
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    if period == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def _increment_score(model, points, **lookup):
+    """Add points to the bucket row matching ``lookup``, creating it if needed."""
+    updated = model.objects.filter(**lookup).update(score=F('score') + points)
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(score=points, **lookup)
+    except IntegrityError:
+        # A concurrent request created the row first
+        model.objects.filter(**lookup).update(score=F('score') + points)
+
+
+def _record_points_earned(player_profile, points, course=None):
+    """Add earned points to the player's period buckets and course cohorts."""
+    today = timezone.localdate()
+    for period in WINDOW_PERIODS:
+        _increment_score(
+            ScoreBucket, points,
+            player=player_profile, period=period, period_start=period_start(period, today),
+        )
+    if course is not None:
+        for cohort in (course_cohort(course.pk), level_cohort(course.level)):
+            _increment_score(CohortScore, points, player=player_profile, cohort=cohort)
+
+
+def _window_queryset(period):
+    """Buckets of the current ``period``, with the player's username as ``name``."""
+    return ScoreBucket.objects.filter(
+        period=period, period_start=period_start(period), score__gt=0
+    ).annotate(name=F('player__user__username'))
+
+
+def get_window_page(period, cursor=None, limit=PAGE_SIZE):
+    """
+    Get one page of the leaderboard for the current day, week or month.
+
+    Served entirely from the rolled-up buckets, using the same keyset
+    pagination as get_page() with the player id as the tie-break.
+
+    Args:
+        period: One of 'day', 'week' or 'month'
+        cursor: Cursor from a previous page, or None for the top page
+        limit: Number of entries per page
+
+    Returns:
+        (buckets, next_cursor); buckets carry ``rank`` and ``name`` attributes
+    """
+    return _keyset_page(_window_queryset(period), 'player_id', cursor, limit, int)
+
+
+def get_window_rank(player_profile, period):
+    """
+    Get a player's 1-based position in the current day, week or month.
+
+    Returns:
+        Rank as an int, or None if the player has no points in the period
+    """
+    bucket = _window_queryset(period).filter(player=player_profile).first()
+    if bucket is None:
+        return None
+    return _window_queryset(period).filter(
+        Q(score__gt=bucket.score) | Q(score=bucket.score, player_id__lt=bucket.player_id)
+    ).count() + 1
+
+
+def count_window_players(period):
+    """Number of players with points in the current day, week or month."""
+    return _window_queryset(period).count()
+
+
+def course_cohort(course_id):
+    """Cohort key of a course leaderboard."""
+    return f'course:{course_id}'
+
+
+def level_cohort(level):
+    """Cohort key of a course level leaderboard."""
+    return f'level:{level}'
+
+
+def _cohort_queryset(cohort):
+    """Scores within ``cohort``, with the player's username as ``name``."""
+    return CohortScore.objects.filter(
+        cohort=cohort, score__gt=0
+    ).annotate(name=F('player__user__username'))
+
+
+def get_cohort_page(cohort, cursor=None, limit=PAGE_SIZE):
+    """
+    Get one page of a course or level leaderboard.
+
+    Pages are range scans on the (cohort, score) index, so a cohort's page
+    never reads rows belonging to other cohorts.
+
+    Args:
+        cohort: Cohort key from course_cohort() or level_cohort()
+        cursor: Cursor from a previous page, or None for the top page
+        limit: Number of entries per page
+
+    Returns:
+        (scores, next_cursor); scores carry ``rank`` and ``name`` attributes
+    """
+    return _keyset_page(_cohort_queryset(cohort), 'player_id', cursor, limit, int)
+
+
+def get_cohort_rank(player_profile, cohort):
+    """
+    Get a player's 1-based position within a cohort.
+
+    Returns:
+        Rank as an int, or None if the player has no points in the cohort
+    """
+    entry = _cohort_queryset(cohort).filter(player=player_profile).first()
+    if entry is None:
+        return None
+    return _cohort_queryset(cohort).filter(
+        Q(score__gt=entry.score) | Q(score=entry.score, player_id__lt=entry.player_id)
+    ).count() + 1
+
+
+def count_cohort_players(cohort):
+    """Number of players with points in a cohort."""
+    return _cohort_queryset(cohort).count()
@@ -0,0 +1,52 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from courses.models import Profile, PlayerProfile
+from courses.utils import create_user_profiles, iter_pk_batches
+
+
+class Command(BaseCommand):
+    help = 'Create the Profile and PlayerProfile rows missing for existing users'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of users checked per batch (default: 500)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report the missing profiles without creating them',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        if batch_size <= 0:
+            self.stderr.write(self.style.ERROR('--batch-size must be a positive integer'))
+            return
+
+        started = time.monotonic()
+        missing = {Profile: 0, PlayerProfile: 0}
+        for rows in iter_pk_batches(User.objects.all(), batch_size):
+            user_ids = [user_id for user_id, in rows]
+            lacking = set()
+            for model in missing:
+                have = set(model.objects.filter(user_id__in=user_ids).values_list('user_id', flat=True))
+                missing_ids = [user_id for user_id in user_ids if user_id not in have]
+                missing[model] += len(missing_ids)
+                lacking.update(missing_ids)
+            if lacking and not dry_run:
+                # Ignores conflicts, so this is safe to run next to live signups
+                create_user_profiles(sorted(lacking))
+
+        verb = 'Would create' if dry_run else 'Created'
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Profile backfill completed in {time.monotonic() - started:.2f}s! '
+                f'{verb} {missing[Profile]} profiles and {missing[PlayerProfile]} player profiles'
+            )
+        )
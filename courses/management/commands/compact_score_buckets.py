@@ -0,0 +1,65 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from courses.leaderboard import period_start
+from courses.models import ScoreBucket
+
+
+class Command(BaseCommand):
+    help = 'Delete score buckets that have fallen out of the retention window'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-days', type=int, default=35,
+                            help='Daily buckets to keep (default: 35)')
+        parser.add_argument('--keep-weeks', type=int, default=26,
+                            help='Weekly buckets to keep (default: 26)')
+        parser.add_argument('--keep-months', type=int, default=24,
+                            help='Monthly buckets to keep (default: 24)')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows deleted per batch (default: 1000)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report what would be deleted without deleting')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        today = timezone.localdate()
+        # Every point is recorded in all three granularities, so old daily
+        # buckets are still summarised by their week and month buckets.
+        cutoffs = {
+            'day': today - timedelta(days=options['keep_days']),
+            'week': period_start('week', today) - timedelta(weeks=options['keep_weeks']),
+            'month': self._months_before(period_start('month', today), options['keep_months']),
+        }
+
+        verb = 'would be removed' if options['dry_run'] else 'removed'
+        total = 0
+        for period, cutoff in cutoffs.items():
+            stale = ScoreBucket.objects.filter(period=period, period_start__lt=cutoff)
+            if options['dry_run']:
+                removed = stale.count()
+            else:
+                removed = self._delete_in_batches(stale, options['batch_size'])
+            total += removed
+            self.stdout.write(f'{period}: {removed} buckets before {cutoff} {verb}')
+
+        self.stdout.write(
+            self.style.SUCCESS(f'{total} buckets {verb} in {time.monotonic() - started:.2f}s')
+        )
+
+    @staticmethod
+    def _months_before(month_start, months):
+        """First day of the month ``months`` months before ``month_start``."""
+        index = month_start.year * 12 + month_start.month - 1 - months
+        return month_start.replace(year=index // 12, month=index % 12 + 1)
+
+    @staticmethod
+    def _delete_in_batches(queryset, batch_size):
+        """Delete the queryset a batch at a time to keep transactions short."""
+        removed = 0
+        while True:
+            ids = list(queryset.values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                return removed
+            removed += ScoreBucket.objects.filter(pk__in=ids).delete()[0]
@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand
+from courses.attempts import prune_finished_attempts
+from courses.jobs import process_pending_jobs
+
+# Seconds between clean-ups of expired quiz attempt claims with --loop
+PRUNE_INTERVAL = 60 * 60
+
+
+class Command(BaseCommand):
+    help = 'Apply queued side effects (quiz completion rows and streaks) and prune expired attempt claims'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Jobs processed per batch (default: 100)')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling for new jobs instead of exiting when the queue is empty')
+        parser.add_argument('--sleep', type=float, default=2.0,
+                            help='Seconds to wait between polls of an empty queue with --loop (default: 2)')
+
+    def handle(self, *args, **options):
+        total_processed = total_failed = 0
+        started = time.monotonic()
+        last_pruned = None
+        # Jobs that failed during the current drain are not picked up again in it
+        failed_ids = set()
+        while True:
+            if last_pruned is None or time.monotonic() - last_pruned >= PRUNE_INTERVAL:
+                pruned = prune_finished_attempts()
+                last_pruned = time.monotonic()
+                if pruned:
+                    self.stdout.write(f'Pruned {pruned} expired quiz attempt claims')
+            processed, failed = process_pending_jobs(options['batch_size'], skip_ids=failed_ids)
+            total_processed += processed
+            total_failed += failed
+            if processed or failed:
+                self.stdout.write(f'Processed {processed} jobs, {failed} failed')
+                continue
+            if not options['loop']:
+                break
+            # Queue drained; the next drain retries jobs whose delay has passed
+            failed_ids.clear()
+            time.sleep(options['sleep'])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Queue drained in {time.monotonic() - started:.2f}s: '
+                f'{total_processed} processed, {total_failed} failed'
+            )
+        )
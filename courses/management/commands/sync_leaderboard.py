@@ -1,46 +1,116 @@
+import time
+
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from courses.models import PlayerProfile, LeaderboardEntry
+from courses.utils import invalidate_leaderboard_cache, iter_pk_batches
 
 
 class Command(BaseCommand):
     help = 'Sync leaderboard entries with current PlayerProfile data'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of rows read and written per batch (default: 500)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report the changes without writing them',
+        )
+
     def handle(self, *args, **options):
-        self.stdout.write('Starting leaderboard sync...')
-        
-        # Count before sync
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        verbose = options['verbosity'] > 1
+        if batch_size <= 0:
+            self.stderr.write(self.style.ERROR('--batch-size must be a positive integer'))
+            return
+
+        self.stdout.write('Starting leaderboard sync...' + (' (dry run)' if dry_run else ''))
+        started = time.monotonic()
         before_count = LeaderboardEntry.objects.count()
-        
-        # Sync leaderboard
-        for profile in PlayerProfile.objects.all():
-            if profile.points > 0:  # Only include users with points
-                entry, created = LeaderboardEntry.objects.get_or_create(
-                    name=profile.user.username,
-                    defaults={'score': 0}
-                )
-                # Update score to match current points
-                if entry.score != profile.points:
-                    entry.score = profile.points
-                    entry.save()
-                    if created:
-                        self.stdout.write(f'Created entry for {profile.user.username}: {profile.points} points')
-                    else:
-                        self.stdout.write(f'Updated entry for {profile.user.username}: {profile.points} points')
-        
-        # Remove entries for users who no longer exist or have 0 points
-        removed_count = LeaderboardEntry.objects.exclude(
-            name__in=PlayerProfile.objects.filter(points__gt=0).values_list('user__username', flat=True)
-        ).count()
-        
-        LeaderboardEntry.objects.exclude(
-            name__in=PlayerProfile.objects.filter(points__gt=0).values_list('user__username', flat=True)
-        ).delete()
-        
+
+        created, updated = self._upsert_entries(batch_size, dry_run, verbose)
+        upsert_elapsed = time.monotonic() - started
+        removed = self._remove_stale_entries(batch_size, dry_run, verbose)
+        total_elapsed = time.monotonic() - started
+
         after_count = LeaderboardEntry.objects.count()
-        
+        if not dry_run:
+            invalidate_leaderboard_cache()
+
         self.stdout.write(
             self.style.SUCCESS(
-                f'Leaderboard sync completed! '
-                f'Before: {before_count}, After: {after_count}, Removed: {removed_count}'
+                f'Leaderboard sync completed in {total_elapsed:.2f}s '
+                f'(upsert {upsert_elapsed:.2f}s, cleanup {total_elapsed - upsert_elapsed:.2f}s)! '
+                f'Before: {before_count}, After: {after_count}, '
+                f'Created: {created}, Updated: {updated}, Removed: {removed}'
             )
         )
+
+    def _upsert_entries(self, batch_size, dry_run, verbose):
+        """Create or update an entry for every profile with points, one batch at a time."""
+        created = updated = 0
+        profiles = PlayerProfile.objects.filter(points__gt=0)
+        for rows in iter_pk_batches(profiles, batch_size, 'user__username', 'points'):
+            batch_started = time.monotonic()
+            last_pk = rows[-1][0]
+
+            wanted = {username: points for _, username, points in rows}
+            existing = {
+                entry.name: entry
+                for entry in LeaderboardEntry.objects.filter(name__in=list(wanted))
+            }
+            to_create = [
+                LeaderboardEntry(name=username, score=points)
+                for username, points in wanted.items()
+                if username not in existing
+            ]
+            to_update = []
+            for username, entry in existing.items():
+                if entry.score != wanted[username]:
+                    entry.score = wanted[username]
+                    to_update.append(entry)
+
+            if not dry_run and (to_create or to_update):
+                with transaction.atomic():
+                    LeaderboardEntry.objects.bulk_create(to_create)
+                    LeaderboardEntry.objects.bulk_update(to_update, ['score'])
+            created += len(to_create)
+            updated += len(to_update)
+
+            if verbose:
+                self.stdout.write(
+                    f'Profiles up to id {last_pk}: {len(to_create)} created, '
+                    f'{len(to_update)} updated ({time.monotonic() - batch_started:.2f}s)'
+                )
+        return created, updated
+
+    def _remove_stale_entries(self, batch_size, dry_run, verbose):
+        """Delete entries for users who no longer exist or have 0 points."""
+        removed = 0
+        for entries in iter_pk_batches(LeaderboardEntry.objects.all(), batch_size, 'name'):
+            batch_started = time.monotonic()
+            last_pk = entries[-1][0]
+
+            names = [name for _, name in entries]
+            keep = set(
+                PlayerProfile.objects
+                .filter(user__username__in=names, points__gt=0)
+                .values_list('user__username', flat=True)
+            )
+            stale_ids = [pk for pk, name in entries if name not in keep]
+            if stale_ids and not dry_run:
+                LeaderboardEntry.objects.filter(pk__in=stale_ids).delete()
+            removed += len(stale_ids)
+
+            if verbose:
+                self.stdout.write(
+                    f'Entries up to id {last_pk}: {len(stale_ids)} removed '
+                    f'({time.monotonic() - batch_started:.2f}s)'
+                )
+        return removed
@@ -0,0 +1,38 @@
+"""
+Request middleware for the courses app.
+"""
+from django.contrib import messages
+from django.utils.functional import SimpleLazyObject
+
+from .utils import get_player_profile, take_pending_notices
+
+
+def _load_player_profile(request):
+    # Resolved on first access, so API views see the user DRF authenticated
+    if not request.user.is_authenticated:
+        return None
+    profile = get_player_profile(request.user)
+    if profile:
+        # Streak notices from the deferred quiz completion job
+        for notice in take_pending_notices(profile):
+            messages.info(request, notice)
+    return profile
+
+
+class PlayerProfileMiddleware:
+    """
+    Expose the current user's PlayerProfile as ``request.player_profile``.
+
+    The profile is loaded lazily, at most once per request, and shared by
+    the views and the active_effects context processor. Loading it writes
+    only to clear notices left by deferred jobs, which are passed on as
+    messages. Anonymous users and users without a profile get a falsy value,
+    so check it with ``if request.player_profile`` rather than ``is None``.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.player_profile = SimpleLazyObject(lambda: _load_player_profile(request))
+        return self.get_response(request)
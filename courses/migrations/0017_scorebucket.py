@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-16 20:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0016_playerprofile_experience_festival_until_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScoreBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('day', 'Day'), ('week', 'Week'), ('month', 'Month')], max_length=5)),
+                ('period_start', models.DateField(help_text='First day of the day/week/month')),
+                ('score', models.IntegerField(default=0)),
+                ('player', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='score_buckets', to='courses.playerprofile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['period', 'period_start', '-score', 'player'], name='idx_scorebucket_window')],
+                'unique_together': {('player', 'period', 'period_start')},
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.5 on 2026-10-16 20:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0017_scorebucket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CohortScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cohort', models.CharField(help_text="Cohort key, e.g. 'course:12' or 'level:Beginner'", max_length=64)),
+                ('score', models.IntegerField(default=0)),
+                ('player', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cohort_scores', to='courses.playerprofile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['cohort', '-score', 'player'], name='idx_cohortscore_rank')],
+                'unique_together': {('cohort', 'player')},
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.5 on 2026-10-16 20:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0018_cohortscore'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeferredJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('quiz_completion', 'Quiz completion')], max_length=32)),
+                ('activity_date', models.DateField(help_text='Date the player did the activity')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.IntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='courses.course')),
+                ('player', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deferred_jobs', to='courses.playerprofile')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('processed_at__isnull', True)), fields=['id'], name='idx_deferredjob_pending')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('processed_at__isnull', True)), fields=('kind', 'player', 'course'), name='uniq_pending_deferredjob')],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-16 20:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0020_course_shopitem_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='completedquiz',
+            index=models.Index(fields=['completed_at'], name='idx_completedquiz_completed'),
+        ),
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(fields=['purchased_at'], name='idx_purchase_purchased_at'),
+        ),
+    ]
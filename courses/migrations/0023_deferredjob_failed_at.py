@@ -0,0 +1,43 @@
+# Generated by Django 5.2.5 on 2026-10-16 21:03
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def mark_exhausted_jobs_failed(apps, schema_editor):
+    # Jobs that already used up their retries (MAX_ATTEMPTS = 5) stop
+    # blocking new jobs for the same player and course
+    DeferredJob = apps.get_model('courses', 'DeferredJob')
+    DeferredJob.objects.filter(processed_at__isnull=True, attempts__gte=5).update(failed_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0022_finishedattempt'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='deferredjob',
+            name='uniq_pending_deferredjob',
+        ),
+        migrations.RemoveIndex(
+            model_name='deferredjob',
+            name='idx_deferredjob_pending',
+        ),
+        migrations.AddField(
+            model_name='deferredjob',
+            name='failed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(mark_exhausted_jobs_failed, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='deferredjob',
+            index=models.Index(condition=models.Q(('failed_at__isnull', True), ('processed_at__isnull', True)), fields=['id'], name='idx_deferredjob_pending'),
+        ),
+        migrations.AddConstraint(
+            model_name='deferredjob',
+            constraint=models.UniqueConstraint(condition=models.Q(('failed_at__isnull', True), ('processed_at__isnull', True)), fields=('kind', 'player', 'course'), name='uniq_pending_deferredjob'),
+        ),
+    ]
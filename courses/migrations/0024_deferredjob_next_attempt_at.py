@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-16 21:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0023_deferredjob_failed_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deferredjob',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-16 22:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0024_deferredjob_next_attempt_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='playerprofile',
+            name='pending_notices',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -23,6 +23,8 @@ class Course(models.Model):
         ('Advanced', 'Advanced')
     ], default='Beginner')
     content = models.TextField(blank=True, null=True, help_text="Full HTML content for this course")
+    # Content version for conditional GETs (ETag / Last-Modified)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.title
@@ -39,6 +41,8 @@ class PlayerProfile(models.Model):
     streak_freeze_count = models.IntegerField(default=0, help_text="Number of streak freeze items")
     fired_up_streak_until = models.DateTimeField(blank=True, null=True, help_text="Fired up streak active until")
     experience_festival_until = models.DateTimeField(blank=True, null=True, help_text="Experience festival active until")
+    # Streak notices from deferred jobs, shown to the player on their next page
+    pending_notices = models.JSONField(default=list, blank=True)
 
     def __str__(self):
         return f"{self.user.username}'s Player Profile"
@@ -49,6 +53,8 @@ class ShopItem(models.Model):
     description = models.TextField()
     price = models.IntegerField(help_text="Cost in points")
     icon = models.CharField(max_length=100, blank=True, help_text="Emoji or image filename")
+    # Content version for conditional GETs (ETag / Last-Modified)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
@@ -59,6 +65,12 @@ class Purchase(models.Model):
     item = models.ForeignKey(ShopItem, on_delete=models.CASCADE)
     purchased_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Cursor pagination of the purchase history, newest first
+            models.Index(fields=['purchased_at'], name='idx_purchase_purchased_at'),
+        ]
+
     def __str__(self):
         return f"{self.player.user.username} bought {self.item.name} on {self.purchased_at.strftime('%Y-%m-%d')}"
 
@@ -98,6 +110,10 @@ class CompletedQuiz(models.Model):
 
     class Meta:
         unique_together = ('player', 'course')
+        indexes = [
+            # Cursor pagination of completions, newest first
+            models.Index(fields=['completed_at'], name='idx_completedquiz_completed'),
+        ]
 
     def __str__(self):
         return f"{self.player.user.username} completed {self.course.title}"
@@ -111,6 +127,45 @@ class LeaderboardEntry(models.Model):
         return f"{self.name}: {self.score}"
 
 
+# 📦 Points earned per player per day/week/month, for time-windowed leaderboards
+class ScoreBucket(models.Model):
+    PERIOD_CHOICES = [
+        ('day', 'Day'),
+        ('week', 'Week'),
+        ('month', 'Month'),
+    ]
+
+    player = models.ForeignKey(PlayerProfile, on_delete=models.CASCADE, related_name='score_buckets')
+    period = models.CharField(max_length=5, choices=PERIOD_CHOICES)
+    period_start = models.DateField(help_text="First day of the day/week/month")
+    score = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('player', 'period', 'period_start')
+        indexes = [
+            models.Index(fields=['period', 'period_start', '-score', 'player'], name='idx_scorebucket_window'),
+        ]
+
+    def __str__(self):
+        return f"{self.player.user.username} {self.period} {self.period_start}: {self.score}"
+
+
+# 📦 Points earned per player within a cohort (one course, or one course level)
+class CohortScore(models.Model):
+    player = models.ForeignKey(PlayerProfile, on_delete=models.CASCADE, related_name='cohort_scores')
+    cohort = models.CharField(max_length=64, help_text="Cohort key, e.g. 'course:12' or 'level:Beginner'")
+    score = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('cohort', 'player')
+        indexes = [
+            models.Index(fields=['cohort', '-score', 'player'], name='idx_cohortscore_rank'),
+        ]
+
+    def __str__(self):
+        return f"{self.player.user.username} {self.cohort}: {self.score}"
+
+
 # 📦 User Settings Model
 class UserSettings(models.Model):
     THEME_CHOICES = [
@@ -129,4 +184,54 @@ class UserSettings(models.Model):
     profile_visibility = models.CharField(max_length=10, choices=VISIBILITY_CHOICES, default='public')
 
     def __str__(self):
-        return f"Settings for {self.user.username}"
\ No newline at end of file
+        return f"Settings for {self.user.username}"
+
+# 📦 Deferred side effects, drained by the process_deferred_jobs command
+class DeferredJob(models.Model):
+    KIND_CHOICES = [
+        ('quiz_completion', 'Quiz completion'),
+    ]
+
+    kind = models.CharField(max_length=32, choices=KIND_CHOICES)
+    player = models.ForeignKey(PlayerProfile, on_delete=models.CASCADE, related_name='deferred_jobs')
+    course = models.ForeignKey(Course, on_delete=models.CASCADE)
+    activity_date = models.DateField(help_text="Date the player did the activity")
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    # A failed job is retried no earlier than this, with exponential backoff
+    next_attempt_at = models.DateTimeField(blank=True, null=True)
+    # Set when the job ran out of retries; it is then left for manual inspection
+    failed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            # At most one pending job per (kind, player, course), so retries are no-ops
+            models.UniqueConstraint(
+                fields=['kind', 'player', 'course'],
+                condition=models.Q(processed_at__isnull=True, failed_at__isnull=True),
+                name='uniq_pending_deferredjob',
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['id'],
+                condition=models.Q(processed_at__isnull=True, failed_at__isnull=True),
+                name='idx_deferredjob_pending',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} for {self.player.user.username} on {self.course.title}"
+
+
+# 📦 Quiz attempts whose points were awarded, so each is claimed only once
+class FinishedAttempt(models.Model):
+    attempt_id = models.CharField(max_length=32, unique=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE)
+    finished_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"Attempt {self.attempt_id} by {self.user.username}"
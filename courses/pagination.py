@@ -0,0 +1,25 @@
+"""
+Pagination for the courses API.
+
+Every list endpoint is cursor-paginated on a stable ordering, so a page is
+an index range scan that costs the same at any depth and never skips or
+repeats rows when new ones are inserted.
+"""
+from rest_framework.pagination import CursorPagination
+
+
+class StableCursorPagination(CursorPagination):
+    """
+    Cursor pagination with a server-enforced maximum page size.
+
+    The default page size is ``REST_FRAMEWORK['PAGE_SIZE']``. Orders by
+    primary key unless the view sets ``cursor_ordering`` to another
+    indexed, rarely changing field.
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = 'id'
+
+    def get_ordering(self, request, queryset, view):
+        ordering = getattr(view, 'cursor_ordering', self.ordering)
+        return (ordering,) if isinstance(ordering, str) else tuple(ordering)
@@ -0,0 +1,77 @@
+"""
+Atomic point accrual for player profiles.
+
+Every change to ``PlayerProfile.points`` goes through this module as a single
+conditional ``UPDATE ... SET points = points + x`` statement, so concurrent
+requests from the same player cannot lose updates or overspend.
+"""
+from django.db import transaction
+from django.db.models import F
+import logging
+
+from .models import PlayerProfile
+from .utils import invalidate_user_cache
+
+logger = logging.getLogger(__name__)
+
+
+def _apply(player_profile, amount, minimum_balance=None):
+    """
+    Add ``amount`` to the player's points in one statement and return the new balance.
+
+    The follow-up read runs in the same transaction as the UPDATE, which
+    holds the row lock, so it sees exactly this change.
+    """
+    queryset = PlayerProfile.objects.filter(pk=player_profile.pk)
+    if minimum_balance is not None:
+        queryset = queryset.filter(points__gte=minimum_balance)
+    with transaction.atomic():
+        if not queryset.update(points=F('points') + amount):
+            return None
+        balance = PlayerProfile.objects.filter(pk=player_profile.pk).values_list('points', flat=True).get()
+    player_profile.points = balance
+    # After commit, so no request renders the old balance under the new generation
+    user_id = player_profile.user_id
+    transaction.on_commit(lambda: invalidate_user_cache(user_id))
+    return balance
+
+
+def credit_points(player_profile, amount):
+    """
+    Add points to a player's balance.
+
+    Args:
+        player_profile: PlayerProfile to credit; its ``points`` is refreshed
+        amount: Non-negative number of points to add
+
+    Returns:
+        The new balance
+    """
+    if amount < 0:
+        raise ValueError("Credit amount must not be negative")
+    balance = _apply(player_profile, amount)
+    logger.debug(f"Credited {amount} points to profile {player_profile.pk}, balance {balance}")
+    return balance
+
+
+def debit_points(player_profile, amount):
+    """
+    Spend points from a player's balance if, and only if, they can afford it.
+
+    The balance check and the subtraction are the same statement
+    (``WHERE points >= amount``), so two concurrent purchases cannot both
+    pass the check.
+
+    Args:
+        player_profile: PlayerProfile to debit; its ``points`` is refreshed on success
+        amount: Non-negative number of points to spend
+
+    Returns:
+        The new balance, or None if the player did not have enough points
+    """
+    if amount < 0:
+        raise ValueError("Debit amount must not be negative")
+    balance = _apply(player_profile, -amount, minimum_balance=amount)
+    if balance is None:
+        logger.debug(f"Insufficient points on profile {player_profile.pk} for debit of {amount}")
+    return balance
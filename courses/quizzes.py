@@ -0,0 +1,393 @@
+"""
+Compiled quiz cache for the courses app.
+
+A quiz, its questions, their options and the correct answers are loaded
+once into a compact immutable structure and kept in the cache, so the quiz
+pages and the quiz API do not query the question tables on every request.
+Entries are invalidated by the Quiz/Question/Option signals, and by
+save_quiz_tree() for its bulk writes, which send no signals.
+"""
+from collections import namedtuple
+from datetime import timedelta
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+import hashlib
+import logging
+
+from .attempts import finish_attempt
+from .leaderboard import record_points_change
+from .models import CompletedQuiz, Option, PlayerProfile, Question, Quiz
+from .points import credit_points
+from .utils import invalidate_user_cache
+
+logger = logging.getLogger(__name__)
+
+# Safety net only; compiled quizzes are invalidated explicitly on change
+COMPILED_QUIZ_TIMEOUT = 60 * 60 * 24
+
+# Points awarded for each correctly answered question
+POINTS_PER_CORRECT = 50
+
+
+class CompiledOption(namedtuple('CompiledOption', ['id', 'text', 'is_correct'])):
+    __slots__ = ()
+
+
+class CompiledQuestion(namedtuple('CompiledQuestion', ['id', 'text', 'options', 'correct_option_ids'])):
+    __slots__ = ()
+
+    def is_correct(self, option_id):
+        """Whether ``option_id`` (int or submitted string) is a correct option."""
+        try:
+            return int(option_id) in self.correct_option_ids
+        except (TypeError, ValueError):
+            return False
+
+
+class CompiledQuiz:
+    """Immutable snapshot of a quiz and its questions, in question id order."""
+
+    __slots__ = ('id', 'course_id', 'title', 'questions', 'version')
+
+    def __init__(self, id, course_id, title, questions):
+        self.id = id
+        self.course_id = course_id
+        self.title = title
+        self.questions = tuple(questions)
+        # Content hash, so consumers can tell when a quiz changed under them
+        self.version = hashlib.sha1(
+            repr((title, self.questions)).encode()
+        ).hexdigest()[:12]
+
+    def __len__(self):
+        return len(self.questions)
+
+    def question(self, number):
+        """Get a question by its 1-based number, or None if out of range."""
+        if 1 <= number <= len(self.questions):
+            return self.questions[number - 1]
+        return None
+
+    def grade(self, answers):
+        """
+        Grade a full set of answers in one pass.
+
+        Args:
+            answers: Mapping of question id (int or str) to selected option id
+
+        Returns:
+            Dict mapping each question id to whether it was answered correctly
+        """
+        answers = {str(question_id): option_id for question_id, option_id in answers.items()}
+        return {
+            question.id: question.is_correct(answers.get(str(question.id)))
+            for question in self.questions
+        }
+
+    def questions_payload(self, answers=True):
+        """
+        Questions in the shape produced by QuestionSerializer.
+
+        Args:
+            answers: Include each option's ``is_correct`` flag; pass False for
+                anything players can read
+        """
+        return [
+            {
+                'id': question.id,
+                'options': [
+                    {
+                        'id': option.id,
+                        'text': option.text,
+                        **({'is_correct': option.is_correct} if answers else {}),
+                        'question': question.id,
+                    }
+                    for option in question.options
+                ],
+                'text': question.text,
+                'quiz': self.id,
+            }
+            for question in self.questions
+        ]
+
+
+def _cache_key(quiz_id):
+    return f'compiled_quiz:{quiz_id}'
+
+
+def _compile(quiz):
+    """Build a CompiledQuiz from a Quiz with prefetched questions and options."""
+    questions = []
+    for question in quiz.questions.all():
+        options = tuple(
+            CompiledOption(option.id, option.text, option.is_correct)
+            for option in question.options.all()
+        )
+        questions.append(CompiledQuestion(
+            question.id,
+            question.text,
+            options,
+            frozenset(option.id for option in options if option.is_correct),
+        ))
+    return CompiledQuiz(quiz.pk, quiz.course_id, quiz.title, questions)
+
+
+def _load_quizzes(quiz_ids):
+    """Load and compile quizzes with two queries for all their questions and options."""
+    quizzes = Quiz.objects.filter(pk__in=quiz_ids).prefetch_related(
+        Prefetch(
+            'questions',
+            queryset=Question.objects.order_by('id').prefetch_related(
+                Prefetch('options', queryset=Option.objects.order_by('id'))
+            ),
+        )
+    )
+    return {quiz.pk: _compile(quiz) for quiz in quizzes}
+
+
+def get_compiled_quiz(quiz_id):
+    """
+    Get the compiled form of a quiz, loading it on a cache miss.
+
+    Args:
+        quiz_id: Primary key of the Quiz
+
+    Returns:
+        CompiledQuiz instance, or None if the quiz does not exist
+    """
+    return get_compiled_quizzes([quiz_id]).get(quiz_id)
+
+
+def get_compiled_quizzes(quiz_ids):
+    """
+    Get the compiled form of several quizzes with one cache round trip.
+
+    Args:
+        quiz_ids: Iterable of Quiz primary keys
+
+    Returns:
+        Dict mapping quiz id to CompiledQuiz; missing quizzes are left out
+    """
+    keys = {_cache_key(quiz_id): quiz_id for quiz_id in quiz_ids}
+    cached = cache.get_many(list(keys))
+    compiled = {keys[key]: value for key, value in cached.items()}
+    missing = [quiz_id for quiz_id in keys.values() if quiz_id not in compiled]
+    if missing:
+        loaded = _load_quizzes(missing)
+        cache.set_many(
+            {_cache_key(quiz_id): value for quiz_id, value in loaded.items()},
+            COMPILED_QUIZ_TIMEOUT,
+        )
+        compiled.update(loaded)
+        logger.debug(f"Compiled quizzes {sorted(loaded)}")
+    return compiled
+
+
+def invalidate_compiled_quiz(quiz_id):
+    """
+    Drop a compiled quiz from the cache so the next request recompiles it.
+
+    Args:
+        quiz_id: Primary key of the Quiz that changed (None is ignored)
+    """
+    if quiz_id is None:
+        return
+    cache.delete(_cache_key(quiz_id))
+    logger.debug(f"Invalidated compiled quiz {quiz_id}")
+
+
+def points_for_correct_answers(player_profile, correct_count):
+    """Points earned for ``correct_count`` right answers, with active multipliers."""
+    points = correct_count * POINTS_PER_CORRECT
+    festival_until = player_profile.experience_festival_until
+    if festival_until and timezone.now() < festival_until:
+        points *= 3
+    return points
+
+
+def record_quiz_completion(player_profile, course, today=None):
+    """
+    Mark a course's quiz completed and advance the player's streak.
+
+    The streak continues if the last activity was today or yesterday, or two
+    days ago when a streak freeze is available (which is then consumed). An
+    active fired-up streak adds three days instead of one.
+
+    Args:
+        player_profile: PlayerProfile completing the quiz
+        course: Course whose quiz was completed
+        today: Activity date (default: today)
+
+    Returns:
+        List of notices for the player about streak items that were applied
+    """
+    today = today or timezone.localdate()
+    notices = []
+    with transaction.atomic():
+        CompletedQuiz.objects.get_or_create(player=player_profile, course=course)
+        # Lock the row and start from its current values, so a concurrent
+        # purchase's streak_freeze_count + 1 is not overwritten
+        profile = PlayerProfile.objects.select_for_update().get(pk=player_profile.pk)
+
+        two_days_ago = today - timedelta(days=2)
+        freeze_needed = (
+            profile.streak_freeze_count > 0 and
+            profile.last_activity_date == two_days_ago
+        )
+        if profile.last_activity_date in (today, today - timedelta(days=1)) or freeze_needed:
+            if freeze_needed:
+                profile.streak_freeze_count -= 1
+                notices.append("❄️ Streak freeze used! Your streak continues.")
+
+            streak_increment = 1
+            if (profile.fired_up_streak_until and
+                    timezone.now() < profile.fired_up_streak_until):
+                streak_increment = 3
+                notices.append("🔥 Fired up streak active! +3 streak days!")
+
+            profile.current_streak = (profile.current_streak or 0) + streak_increment
+        else:
+            profile.current_streak = 1
+
+        if profile.current_streak > (profile.longest_streak or 0):
+            profile.longest_streak = profile.current_streak
+        profile.last_activity_date = today
+        streak_fields = ['current_streak', 'longest_streak', 'last_activity_date', 'streak_freeze_count']
+        profile.save(update_fields=streak_fields)
+
+    for field in streak_fields + ['fired_up_streak_until']:
+        setattr(player_profile, field, getattr(profile, field))
+    # Callers may still hold an open transaction (e.g. the job worker)
+    user_id = player_profile.user_id
+    transaction.on_commit(lambda: invalidate_user_cache(user_id))
+    return notices
+
+
+def submit_quiz(player_profile, course, quiz, answers, attempt):
+    """
+    Grade a whole quiz submission and apply all of its effects at once.
+
+    Points, the completion record, the streak and the leaderboards are
+    updated in a single transaction, together with the claim on the
+    attempt, so each attempt is credited only once.
+
+    Args:
+        player_profile: PlayerProfile submitting the answers
+        course: Course the quiz belongs to
+        quiz: CompiledQuiz being answered
+        answers: Mapping of question id to selected option id
+        attempt: Attempt state from load_attempt()
+
+    Returns:
+        Dict with the score, total_questions, gained_points, per-question
+        results and streak notices, or None if the attempt was already
+        submitted
+    """
+    results = quiz.grade(answers)
+    score = sum(results.values())
+
+    with transaction.atomic():
+        if not finish_attempt(attempt):
+            return None
+        gained_points = points_for_correct_answers(player_profile, score)
+        if gained_points:
+            credit_points(player_profile, gained_points)
+            record_points_change(player_profile, gained_points, course=course)
+        notices = record_quiz_completion(player_profile, course)
+
+    return {
+        'score': score,
+        'total_questions': len(quiz),
+        'gained_points': gained_points,
+        'results': results,
+        'notices': notices,
+    }
+
+
+
+def save_quiz_tree(quiz_id, questions):
+    """
+    Replace a quiz's questions and options with the given tree in one transaction.
+
+    Entries with an ``id`` update that question or option, entries without
+    one are created, and questions or options of the quiz missing from the
+    tree are deleted. Writes are batched with bulk_create/bulk_update, so
+    the number of queries does not depend on the size of the quiz.
+
+    Args:
+        quiz_id: Primary key of the Quiz to author
+        questions: List of ``{'id'?, 'text', 'options': [{'id'?, 'text',
+            'is_correct'}]}`` dicts; new entries are added in list order
+
+    Returns:
+        The compiled quiz as saved
+
+    Raises:
+        ValueError: If an id does not belong to this quiz, or an option id
+            is listed under a different question than its own
+    """
+    with transaction.atomic():
+        existing_questions = {
+            question.pk: question
+            for question in Question.objects.select_for_update().filter(quiz_id=quiz_id)
+        }
+        existing_options = {
+            option.pk: option
+            for option in Option.objects.filter(question__quiz_id=quiz_id)
+        }
+
+        instances, questions_to_update, questions_to_create = [], [], []
+        for entry in questions:
+            if entry.get('id') is None:
+                question = Question(quiz_id=quiz_id, text=entry['text'])
+                questions_to_create.append(question)
+            else:
+                question = existing_questions.get(entry['id'])
+                if question is None:
+                    raise ValueError(f"Question {entry['id']} does not belong to quiz {quiz_id}")
+                question.text = entry['text']
+                questions_to_update.append(question)
+            instances.append(question)
+
+        Question.objects.bulk_update(questions_to_update, ['text'])
+        Question.objects.bulk_create(questions_to_create)
+
+        options_to_update, options_to_create = [], []
+        for entry, question in zip(questions, instances):
+            for option_entry in entry['options']:
+                if option_entry.get('id') is None:
+                    options_to_create.append(Option(
+                        question=question,
+                        text=option_entry['text'],
+                        is_correct=option_entry['is_correct'],
+                    ))
+                    continue
+                option = existing_options.get(option_entry['id'])
+                if option is None or option.question_id != question.pk:
+                    raise ValueError(f"Option {option_entry['id']} does not belong to that question")
+                option.text = option_entry['text']
+                option.is_correct = option_entry['is_correct']
+                options_to_update.append(option)
+
+        Option.objects.bulk_update(options_to_update, ['text', 'is_correct'])
+        Option.objects.bulk_create(options_to_create)
+
+        kept_options = {option.pk for option in options_to_update}
+        kept_questions = {question.pk for question in questions_to_update}
+        Option.objects.filter(pk__in=set(existing_options) - kept_options).delete()
+        Question.objects.filter(pk__in=set(existing_questions) - kept_questions).delete()
+
+        # Bulk writes send no signals, so drop the compiled quiz explicitly
+        # once the new tree is visible to other requests
+        transaction.on_commit(lambda: invalidate_compiled_quiz(quiz_id))
+
+        logger.info(
+            f"Saved quiz {quiz_id}: {len(questions_to_create)} questions created, "
+            f"{len(questions_to_update)} updated; {len(options_to_create)} options created, "
+            f"{len(options_to_update)} updated"
+        )
+        # Compiled from this transaction, not the cache, which may still
+        # hold the old tree until commit
+        return _load_quizzes([quiz_id])[quiz_id]
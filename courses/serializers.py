@@ -4,73 +4,223 @@ from .models import (
     Profile, Course, PlayerProfile, ShopItem, Purchase,
     Quiz, Question, Option, CompletedQuiz, LeaderboardEntry
 )
-
-class UserSerializer(serializers.ModelSerializer):
+from .quizzes import get_compiled_quiz
+
+def _query_param_set(request, name):
+    """Comma-separated query parameter as a set, or None if absent."""
+    if request is None:
+        return None
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    return {part.strip() for part in value.split(',') if part.strip()}
+
+def requested_fields(request):
+    """Field names selected with ?fields=, or None for all fields."""
+    return _query_param_set(request, 'fields')
+
+def requested_expansions(request):
+    """Relation names selected with ?expand=."""
+    return _query_param_set(request, 'expand') or set()
+
+class DynamicFieldsModelSerializer(serializers.ModelSerializer):
+    """
+    ModelSerializer with client-selected fields and opt-in nested expansion.
+
+    ``?fields=id,title`` keeps only the listed fields. Relations render as
+    ids unless listed in ``?expand=``, which renders them with the
+    serializer given in ``expandable_fields``. Both apply to the top-level
+    serializer of a request only; expanded objects show their own
+    relations as ids.
+    """
+    # Relation name -> (serializer class, extra kwargs) used for ?expand=
+    expandable_fields = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Nested serializers get no context of their own, so only the
+        # top-level serializer reads the query parameters
+        request = self._context.get('request')
+        for name in requested_expansions(request) & set(self.expandable_fields):
+            serializer_class, extra = self.expandable_fields[name]
+            self.fields[name] = serializer_class(read_only=True, **extra)
+        fields = requested_fields(request)
+        if fields is not None:
+            for name in set(self.fields) - fields:
+                self.fields.pop(name)
+
+    @classmethod
+    def optimize_queryset(cls, queryset, request, keep=()):
+        """
+        Fit a queryset to the fields a request will serialize.
+
+        Columns left out by ``?fields=`` are deferred, forward relations are
+        joined only when expanded, and reverse relations are prefetched
+        whenever they are shown, as ids or expanded.
+
+        Args:
+            queryset: Base queryset of the viewset
+            request: Current DRF request
+            keep: Field names never to defer, e.g. the pagination ordering
+
+        Returns:
+            The adjusted queryset
+        """
+        opts = queryset.model._meta
+        fields = requested_fields(request)
+        expand = requested_expansions(request)
+        if fields is not None:
+            deferred = [
+                field.name for field in opts.concrete_fields
+                if not field.primary_key and field.name not in fields and field.name not in keep
+            ]
+            if deferred:
+                queryset = queryset.defer(*deferred)
+        for name, (serializer_class, _) in cls.expandable_fields.items():
+            if fields is not None and name not in fields:
+                continue
+            if name in expand and not issubclass(serializer_class, serializers.BaseSerializer):
+                # Expanded by a plain field that reads no relation (e.g. from a cache)
+                continue
+            field = opts.get_field(name)
+            if field.concrete:
+                if name in expand:
+                    queryset = queryset.select_related(name)
+            else:
+                queryset = queryset.prefetch_related(name)
+        return queryset
+
+class UserSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = User
-        fields = ['id', 'username', 'email']
+        # Public output, so no email
+        fields = ['id', 'username']
 
-class ProfileSerializer(serializers.ModelSerializer):
-    user = UserSerializer()
+class ProfileSerializer(DynamicFieldsModelSerializer):
+    expandable_fields = {'user': (UserSerializer, {})}
 
     class Meta:
         model = Profile
-        fields = '__all__'
+        # Public output, so no bio, location or birth date
+        fields = ['id', 'user', 'profile_picture']
 
-class CourseSerializer(serializers.ModelSerializer):
+class CourseSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = Course
         fields = '__all__'
 
-class PlayerProfileSerializer(serializers.ModelSerializer):
-    user = UserSerializer()
+class PlayerProfileSerializer(DynamicFieldsModelSerializer):
+    expandable_fields = {'user': (UserSerializer, {})}
 
     class Meta:
         model = PlayerProfile
         fields = '__all__'
 
-class ShopItemSerializer(serializers.ModelSerializer):
+class ShopItemSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = ShopItem
         fields = '__all__'
 
-class PurchaseSerializer(serializers.ModelSerializer):
-    player = PlayerProfileSerializer()
-    item = ShopItemSerializer()
+class PurchaseSerializer(DynamicFieldsModelSerializer):
+    expandable_fields = {
+        'player': (PlayerProfileSerializer, {}),
+        'item': (ShopItemSerializer, {}),
+    }
 
     class Meta:
         model = Purchase
         fields = '__all__'
 
-class OptionSerializer(serializers.ModelSerializer):
+class OptionSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = Option
-        fields = '__all__'
+        # The answer key is only shown through the admin-only tree action
+        exclude = ['is_correct']
 
-class QuestionSerializer(serializers.ModelSerializer):
-    options = OptionSerializer(many=True)
+class QuestionSerializer(DynamicFieldsModelSerializer):
+    options = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+    expandable_fields = {'options': (OptionSerializer, {'many': True})}
 
     class Meta:
         model = Question
         fields = '__all__'
 
-class QuizSerializer(serializers.ModelSerializer):
-    questions = QuestionSerializer(many=True)
-    course = CourseSerializer()
+class CompiledQuestionsField(serializers.Field):
+    """A quiz's questions and options, served from the compiled quiz cache."""
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, quiz):
+        compiled = self.context.get('compiled_quizzes', {}).get(quiz.pk) or get_compiled_quiz(quiz.pk)
+        return compiled.questions_payload(answers=False) if compiled else []
+
+class QuizSerializer(DynamicFieldsModelSerializer):
+    questions = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+    expandable_fields = {
+        'course': (CourseSerializer, {}),
+        'questions': (CompiledQuestionsField, {}),
+    }
 
     class Meta:
         model = Quiz
         fields = '__all__'
 
-class CompletedQuizSerializer(serializers.ModelSerializer):
-    player = PlayerProfileSerializer()
-    course = CourseSerializer()
+class QuizSubmissionSerializer(serializers.Serializer):
+    """Answers for a whole quiz, keyed by question id, for one started attempt."""
+    attempt = serializers.CharField()
+    answers = serializers.DictField(child=serializers.IntegerField())
+
+class OptionTreeSerializer(serializers.Serializer):
+    """One option in a quiz tree; omit id to create it."""
+    id = serializers.IntegerField(required=False)
+    text = serializers.CharField(max_length=255)
+    is_correct = serializers.BooleanField(default=False)
+
+class QuestionTreeSerializer(serializers.Serializer):
+    """One question in a quiz tree with all of its options; omit id to create it."""
+    id = serializers.IntegerField(required=False)
+    text = serializers.CharField(max_length=255)
+    options = OptionTreeSerializer(many=True, allow_empty=False)
+
+    def validate_options(self, options):
+        if not any(option['is_correct'] for option in options):
+            raise serializers.ValidationError("At least one option must be correct.")
+        return options
+
+class QuizTreeSerializer(serializers.Serializer):
+    """A whole quiz's questions and options, for bulk authoring."""
+    questions = QuestionTreeSerializer(many=True)
+
+    def validate_questions(self, questions):
+        question_ids = [question['id'] for question in questions if 'id' in question]
+        option_ids = [
+            option['id'] for question in questions
+            for option in question['options'] if 'id' in option
+        ]
+        if len(question_ids) != len(set(question_ids)) or len(option_ids) != len(set(option_ids)):
+            raise serializers.ValidationError("Each question and option id may appear only once.")
+        return questions
+
+class CompletedQuizSerializer(DynamicFieldsModelSerializer):
+    expandable_fields = {
+        'player': (PlayerProfileSerializer, {}),
+        'course': (CourseSerializer, {}),
+    }
 
     class Meta:
         model = CompletedQuiz
         fields = '__all__'
 
-class LeaderboardEntrySerializer(serializers.ModelSerializer):
+class LeaderboardEntrySerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = LeaderboardEntry
         fields = '__all__'
+
+class RankedLeaderboardEntrySerializer(serializers.Serializer):
+    """Read-only leaderboard row for any ranked page (all-time or windowed)."""
+    rank = serializers.IntegerField(read_only=True)
+    name = serializers.CharField(read_only=True)
+    score = serializers.IntegerField(read_only=True)
@@ -1,16 +1,40 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.contrib.auth.models import User
 from django.dispatch import receiver
-from .models import Profile, PlayerProfile
+from .models import Course, Quiz, Question, Option, ShopItem
+from .quizzes import invalidate_compiled_quiz
+from .utils import create_user_profiles, invalidate_course_cache, invalidate_shop_cache
 
-# Create or update the user's profile when User is saved
+# Create the user's profiles when a User is created. Later saves (e.g. the
+# last_login update on every login) and fixture loading touch nothing.
 @receiver(post_save, sender=User)
-def create_or_update_user_profile(sender, instance, created, **kwargs):
-    if created:
-        Profile.objects.create(user=instance)
-        PlayerProfile.objects.create(user=instance)
-    else:
-        instance.profile.save()
-        # Update PlayerProfile if it exists
-        if hasattr(instance, 'playerprofile'):
-            instance.playerprofile.save()
+def create_user_profile(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        create_user_profiles([instance.pk])
+
+# Start a new cache generation for a course whenever it changes. Only once
+# the change commits, so no request caches the old page under the new one.
+@receiver([post_save, post_delete], sender=Course)
+def invalidate_course(sender, instance, **kwargs):
+    course_id = instance.pk
+    transaction.on_commit(lambda: invalidate_course_cache(course_id))
+
+# Start a new cache generation for the shop whenever an item changes
+@receiver([post_save, post_delete], sender=ShopItem)
+def invalidate_shop(sender, instance, **kwargs):
+    transaction.on_commit(invalidate_shop_cache)
+
+# Drop the compiled quiz cache whenever a quiz, question or option changes
+@receiver([post_save, post_delete], sender=Quiz)
+def invalidate_quiz(sender, instance, **kwargs):
+    invalidate_compiled_quiz(instance.pk)
+
+@receiver([post_save, post_delete], sender=Question)
+def invalidate_question_quiz(sender, instance, **kwargs):
+    invalidate_compiled_quiz(instance.quiz_id)
+
+@receiver([post_save, post_delete], sender=Option)
+def invalidate_option_quiz(sender, instance, **kwargs):
+    quiz_id = Question.objects.filter(pk=instance.question_id).values_list('quiz_id', flat=True).first()
+    invalidate_compiled_quiz(quiz_id)
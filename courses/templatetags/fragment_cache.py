@@ -0,0 +1,22 @@
+"""
+Template helpers for versioned fragment caching.
+
+Use the current generation of a cache namespace as a ``{% cache %}`` vary-on
+argument, so invalidating the namespace (e.g. on a Course save) drops the
+cached fragments built from it::
+
+    {% load cache fragment_cache %}
+    {% cache_version 'catalog' as catalog_version %}
+    {% cache 600 course_cards catalog_version %}...{% endcache %}
+"""
+from django import template
+
+from courses.utils import get_generations
+
+register = template.Library()
+
+
+@register.simple_tag
+def cache_version(namespace):
+    """Current generation number of a cache namespace."""
+    return get_generations(namespace)[namespace]
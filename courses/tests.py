@@ -0,0 +1,835 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
+import csv
+import json
+import threading
+import time
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.sessions.backends.db import SessionStore
+from django.core import signing
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.db.models import F
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from courses.attempts import ATTEMPT_MAX_AGE, ATTEMPT_SALT, prune_finished_attempts
+from courses.cache_backends import TwoTierCache
+from courses.jobs import JOB_HANDLERS, enqueue_quiz_completion, process_pending_jobs
+from courses.leaderboard import decode_cursor, encode_cursor
+from courses.models import (
+    CompletedQuiz, Course, DeferredJob, FinishedAttempt, LeaderboardEntry, Option, PlayerProfile, Profile,
+    Purchase, Question, Quiz, ShopItem, UserSettings,
+)
+from courses.points import credit_points, debit_points
+from courses.quizzes import record_quiz_completion, save_quiz_tree
+from courses.urls import router
+from courses.utils import (
+    SHOP_NAMESPACE, bump_generation, cache_view, course_namespace, get_generations, get_or_compute_leaderboard,
+    user_namespace,
+)
+
+
+def run_concurrently(*callables):
+    """Run each callable in its own thread and database connection, released together."""
+    barrier = threading.Barrier(len(callables))
+    errors = []
+
+    def run(func):
+        try:
+            barrier.wait()
+            func()
+        except Exception as e:
+            errors.append(e)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=run, args=(func,)) for func in callables]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+
+
+def create_quiz(title='Python', questions=1):
+    """
+    A course with a quiz of ``questions`` questions, each with a right and a wrong option.
+
+    Returns:
+        (course, quiz, first question, its right option)
+    """
+    course = Course.objects.create(title=title, description='Basics')
+    quiz = Quiz.objects.create(course=course, title=f'{title} quiz')
+    for number in range(questions):
+        question = Question.objects.create(quiz=quiz, text=f'Question {number}')
+        Option.objects.create(question=question, text='Right', is_correct=True)
+        Option.objects.create(question=question, text='Wrong')
+    first = quiz.questions.order_by('pk').first()
+    return course, quiz, first, first.options.get(is_correct=True) if first else None
+
+
+def points_of(profile):
+    """A player's current balance, read from the database."""
+    profile.refresh_from_db()
+    return profile.points
+
+
+# 📦 Point accrual
+
+class ConcurrentPointsTests(TransactionTestCase):
+    """Concurrent credits and debits on one profile, each thread on its own connection."""
+
+    def setUp(self):
+        user = User.objects.create_user('racer', password='x')
+        self.profile = PlayerProfile.objects.get(user=user)
+
+    def new_handle(self):
+        # Each thread gets its own instance, as each request would
+        return PlayerProfile.objects.get(pk=self.profile.pk)
+
+    def test_concurrent_credits_lose_no_updates(self):
+        def credit():
+            profile = self.new_handle()
+            for _ in range(5):
+                credit_points(profile, 10)
+
+        run_concurrently(*[credit] * 8)
+
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.points, 8 * 5 * 10)
+
+    def test_concurrent_debits_never_overspend(self):
+        credit_points(self.profile, 100)
+        balances = []
+
+        def debit():
+            balances.append(debit_points(self.new_handle(), 30))
+
+        run_concurrently(*[debit] * 8)
+
+        successful = [balance for balance in balances if balance is not None]
+        self.assertEqual(len(successful), 3)
+        self.assertTrue(all(balance >= 0 for balance in successful))
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.points, 10)
+
+    def test_mixed_credits_and_debits_balance(self):
+        credit_points(self.profile, 50)
+        balances = []
+        debited = []
+
+        def credit():
+            profile = self.new_handle()
+            for _ in range(5):
+                balances.append(credit_points(profile, 5))
+
+        def debit():
+            profile = self.new_handle()
+            for _ in range(5):
+                balance = debit_points(profile, 20)
+                if balance is not None:
+                    debited.append(20)
+                    balances.append(balance)
+
+        run_concurrently(*[credit] * 4, *[debit] * 4)
+
+        self.assertTrue(all(balance >= 0 for balance in balances))
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.points, 50 + 4 * 5 * 5 - sum(debited))
+        self.assertGreaterEqual(self.profile.points, 0)
+
+
+# 📦 Page query budgets
+
+class PageQueryCountTests(TestCase):
+    """
+    Query budgets for the main pages of a signed-in player, rendered cold.
+
+    Every page loads the player's profile exactly once, through
+    PlayerProfileMiddleware, however often the view and the context
+    processor read it.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', password='x')
+        cls.course, *_ = create_quiz(questions=3)
+        ShopItem.objects.create(name='Streak freeze', description='Keeps a streak', price=10)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def assertPageQueries(self, url, num):
+        with self.assertNumQueries(num) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        profile_selects = [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('SELECT') and 'FROM "courses_playerprofile"' in query['sql']
+        ]
+        self.assertEqual(len(profile_selects), 1, profile_selects)
+
+    def test_home(self):
+        # Session, user, profile
+        self.assertPageQueries(reverse('home'), 3)
+
+    def test_course_list(self):
+        # Session, user, table version, profile, completions, courses
+        self.assertPageQueries(reverse('course_list'), 6)
+
+    def test_course_detail(self):
+        # Session, user, row version, profile, course with quiz
+        self.assertPageQueries(reverse('course_detail', args=[self.course.pk]), 5)
+
+    def test_shop(self):
+        # Session, user, table version, profile, items
+        self.assertPageQueries(reverse('shop'), 5)
+
+    def test_quiz_view(self):
+        # Session, user, course with quiz, compiled quiz (quiz, questions, options), profile
+        self.assertPageQueries(reverse('quiz', args=[self.course.pk, 1]), 7)
+
+
+# 📦 API list query counts
+
+class ApiListQueryCountTests(TestCase):
+    """
+    Every /api/ list endpoint runs the same number of queries for a page of
+    a few rows as for a page of many, both with relations as ids and with
+    all of them expanded, so no serializer issues per-row queries.
+    """
+
+    def setUp(self):
+        self.seeded = 0
+        reader = User.objects.create_user('reader', password='x')
+        self.reader = PlayerProfile.objects.get(user=reader)
+        self.client.force_login(reader)
+
+    def seed(self, count):
+        """Add ``count`` rows to every table behind the API, all related to each other."""
+        for number in range(self.seeded, self.seeded + count):
+            # Other players' profiles, for the public profile list
+            User.objects.create_user(f'player{number}', password='x')
+            course, *_ = create_quiz(f'Course {number}', questions=2)
+            item = ShopItem.objects.create(name=f'Item {number}', description='d', price=10)
+            # Purchases and completions are listed to their owner only
+            Purchase.objects.create(player=self.reader, item=item)
+            CompletedQuiz.objects.create(player=self.reader, course=course)
+            LeaderboardEntry.objects.create(name=f'player{number}', score=number)
+        self.seeded += count
+
+    def list_urls(self):
+        """(label, url) for every router list endpoint, plain and fully expanded."""
+        for prefix, viewset, basename in router.registry:
+            url = reverse(f'{basename}-list')
+            yield prefix, url
+            expandable = viewset.serializer_class.expandable_fields
+            if expandable:
+                yield f'{prefix}?expand', f"{url}?expand={','.join(expandable)}"
+
+    def count_queries(self):
+        counts = {}
+        for label, url in self.list_urls():
+            # Cold cache, so cached payloads (e.g. compiled quizzes) are counted too
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, label)
+            counts[label] = len(queries)
+        return counts
+
+    def test_query_count_does_not_grow_with_rows(self):
+        self.seed(2)
+        few = self.count_queries()
+        self.seed(8)
+        many = self.count_queries()
+        for label in few:
+            with self.subTest(endpoint=label):
+                self.assertEqual(many[label], few[label])
+
+    def test_sparse_fields_keep_the_cursor_ordering_loaded(self):
+        self.seed(6)
+        for url in ['/api/purchases/', '/api/completed-quizzes/', '/api/leaderboard-entries/']:
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as full:
+                    self.client.get(url, {'page_size': 5})
+                with CaptureQueriesContext(connection) as sparse:
+                    response = self.client.get(url, {'page_size': 5, 'fields': 'id'})
+                self.assertIsNotNone(response.json()['next'])
+                self.assertEqual(len(sparse), len(full))
+
+
+# 📦 Public API surface
+
+class ApiExposureTests(TestCase):
+    """The API is read-only, never shows emails or answer keys, and keeps private data private."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', email='owner@example.com', password='x')
+        cls.other = User.objects.create_user('other', password='x')
+        create_quiz()
+        cls.item = ShopItem.objects.create(name='Streak freeze', description='Keeps a streak', price=10)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_no_emails_or_answer_keys(self):
+        for url in [
+            '/api/profiles/?expand=user',
+            '/api/player-profiles/?expand=user',
+            '/api/options/',
+            '/api/questions/?expand=options',
+            '/api/quizzes/?expand=questions',
+        ]:
+            with self.subTest(url=url):
+                content = self.client.get(url).content.decode()
+                self.assertNotIn('owner@example.com', content)
+                self.assertNotIn('is_correct', content)
+
+    def test_private_profiles_and_personal_details_are_hidden(self):
+        Profile.objects.filter(user=self.owner).update(bio='Secret bio', location='Helsinki')
+        UserSettings.objects.create(user=self.owner, profile_visibility='private')
+        response = self.client.get('/api/profiles/')
+        self.assertEqual(response.status_code, 200)
+        usernames = [profile['user'] for profile in response.json()['results']]
+        self.assertEqual(usernames, [self.other.pk])
+        self.assertEqual(set(response.json()['results'][0]), {'id', 'user', 'profile_picture'})
+
+    def test_player_data_is_owner_only(self):
+        owner_profile = PlayerProfile.objects.get(user=self.owner)
+        Purchase.objects.create(player=owner_profile, item=self.item)
+        CompletedQuiz.objects.create(player=owner_profile, course=Course.objects.get())
+        for url in ['/api/player-profiles/', '/api/purchases/', '/api/completed-quizzes/']:
+            with self.subTest(url=url, user=None):
+                self.assertIn(self.client.get(url).status_code, [401, 403])
+        self.client.force_login(self.other)
+        for url in ['/api/player-profiles/', '/api/purchases/', '/api/completed-quizzes/']:
+            with self.subTest(url=url, user='other'):
+                results = self.client.get(url).json()['results']
+                self.assertNotIn(owner_profile.pk, [row.get('player', row['id']) for row in results])
+        self.assertEqual(self.client.get(f'/api/player-profiles/{owner_profile.pk}/').status_code, 404)
+
+    def test_model_writes_are_refused(self):
+        self.client.force_login(self.other)
+        owner_profile = PlayerProfile.objects.get(user=self.owner)
+        other_profile = PlayerProfile.objects.get(user=self.other)
+        responses = [
+            self.client.patch(
+                f'/api/player-profiles/{owner_profile.pk}/', {'points': 999999}, content_type='application/json'
+            ),
+            self.client.post('/api/purchases/', {'player': other_profile.pk, 'item': self.item.pk}),
+            self.client.delete(f'/api/shop-items/{self.item.pk}/'),
+        ]
+        self.assertEqual([response.status_code for response in responses], [405, 405, 405])
+        owner_profile.refresh_from_db()
+        self.assertEqual(owner_profile.points, 0)
+        self.assertFalse(Purchase.objects.exists())
+        self.assertTrue(ShopItem.objects.filter(pk=self.item.pk).exists())
+
+
+# 📦 Quiz attempt tokens
+
+class QuizAttemptTokenTests(TestCase):
+    """Per-question attempts: forged tokens restart the quiz and finished ones earn nothing twice."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('alice', password='x')
+        self.profile = PlayerProfile.objects.get(user=self.user)
+        self.course, _, self.question, self.right = create_quiz()
+        self.client.force_login(self.user)
+
+    def answer_right(self, token=None):
+        """Answer the only question correctly; returns the URL of the finished attempt."""
+        url = reverse('quiz', args=[self.course.pk, 1])
+        token = token or self.client.get(url).context['attempt_token']
+        return self.client.post(url, {'attempt': token, 'selected_option': self.right.pk})['Location']
+
+    def test_attempt_cannot_be_replayed_after_its_claim_is_pruned(self):
+        started = time.time()
+        first_token = self.client.get(reverse('quiz', args=[self.course.pk, 1])).context['attempt_token']
+        self.client.get(self.answer_right(first_token))
+        self.assertEqual(points_of(self.profile), 50)
+
+        # Re-answer with the held first token just before it would expire...
+        with mock.patch('time.time', return_value=started + ATTEMPT_MAX_AGE - 60):
+            replay_url = self.answer_right(first_token)
+        # ...and open the fresh finish URL once the claim is gone
+        FinishedAttempt.objects.update(finished_at=timezone.now() - timedelta(seconds=ATTEMPT_MAX_AGE + 60))
+        self.assertEqual(prune_finished_attempts(), 1)
+        with mock.patch('time.time', return_value=started + ATTEMPT_MAX_AGE + 60):
+            response = self.client.get(replay_url)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(points_of(self.profile), 50)
+
+    def test_whole_quiz_result_token_is_not_a_per_question_attempt(self):
+        url = reverse('quiz_submit', args=[self.course.pk])
+        token = self.client.get(url).context['attempt_token']
+        data = {'attempt': token, f'question_{self.question.pk}': self.right.pk}
+        result_url = self.client.post(url, data)['Location']
+        result_token = parse_qs(urlsplit(result_url).query)['attempt'][0]
+        response = self.client.get(reverse('quiz', args=[self.course.pk, 1]), {'attempt': result_token})
+        # A fresh attempt is started instead of continuing the finished one
+        self.assertNotEqual(response.context['attempt_token'], result_token)
+        self.assertEqual(points_of(self.profile), 50)
+
+    def test_replayed_finish_url_is_credited_once(self):
+        finish_url = self.answer_right()
+        self.assertEqual(self.client.get(finish_url).context['gained_points'], 50)
+        self.assertEqual(self.client.get(finish_url).context['gained_points'], 0)
+        self.assertEqual(points_of(self.profile), 50)
+        self.assertEqual(FinishedAttempt.objects.count(), 1)
+
+    def test_forged_token_restarts_the_quiz(self):
+        finish_url = self.answer_right()
+        state = signing.loads(parse_qs(urlsplit(finish_url).query)['attempt'][0], salt=ATTEMPT_SALT)
+        # The same attempt with an inflated score, signed without the server's key
+        forged = signing.dumps(dict(state, score=100), key='not-the-secret-key', salt=ATTEMPT_SALT, compress=True)
+        response = self.client.get(reverse('quiz', args=[self.course.pk, 2]), {'attempt': forged})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(reverse('quiz', args=[self.course.pk, 1]), response['Location'])
+        self.assertEqual(points_of(self.profile), 0)
+
+    def test_token_of_another_user_is_refused(self):
+        finish_url = self.answer_right()
+        self.client.force_login(User.objects.create_user('mallory', password='x'))
+        response = self.client.get(finish_url)
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(FinishedAttempt.objects.exists())
+        self.assertEqual(points_of(self.profile), 0)
+
+
+# 📦 Whole-quiz submission
+
+class QuizSubmissionTests(TestCase):
+    """Each whole-quiz attempt is credited once, and its result page can be reloaded."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('alice', password='x')
+        self.profile = PlayerProfile.objects.get(user=self.user)
+        self.course, self.quiz, self.question, self.right = create_quiz()
+        self.client.force_login(self.user)
+
+    def test_api_attempt_is_credited_once(self):
+        token = self.client.post(f'/api/quizzes/{self.quiz.pk}/attempt/').json()['attempt']
+        payload = {'attempt': token, 'answers': {str(self.question.pk): self.right.pk}}
+        first = self.client.post(f'/api/quizzes/{self.quiz.pk}/submit/', payload, content_type='application/json')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.json()['gained_points'], 50)
+        replay = self.client.post(f'/api/quizzes/{self.quiz.pk}/submit/', payload, content_type='application/json')
+        self.assertEqual(replay.status_code, 409)
+        self.assertEqual(points_of(self.profile), 50)
+
+    def test_api_submission_needs_a_valid_attempt(self):
+        url = f'/api/quizzes/{self.quiz.pk}/submit/'
+        answers = {str(self.question.pk): self.right.pk}
+        for token in ['', 'forged']:
+            with self.subTest(token=token):
+                response = self.client.post(url, {'attempt': token, 'answers': answers}, content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+        self.assertEqual(points_of(self.profile), 0)
+
+    def test_form_redirects_to_a_reloadable_result(self):
+        url = reverse('quiz_submit', args=[self.course.pk])
+        token = self.client.get(url).context['attempt_token']
+        data = {'attempt': token, f'question_{self.question.pk}': self.right.pk}
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 302)
+        for _ in range(2):
+            result = self.client.get(response['Location'])
+            self.assertTemplateUsed(result, 'quiz_complete.html')
+            self.assertEqual(result.context['gained_points'], 50)
+        # Resubmitting the same attempt earns nothing
+        self.client.post(url, data)
+        self.assertEqual(points_of(self.profile), 50)
+
+
+# 📦 Quiz authoring
+
+class QuizTreeTests(TestCase):
+    """Bulk quiz authoring only touches the quiz's own rows and deletes what the tree omits."""
+
+    def setUp(self):
+        cache.clear()
+        _, self.quiz, self.question, self.right = create_quiz()
+        self.wrong = self.question.options.get(is_correct=False)
+        _, _, self.foreign_question, self.foreign_option = create_quiz('Django')
+
+    def test_omitted_entries_are_deleted_and_new_ones_created(self):
+        compiled = save_quiz_tree(self.quiz.pk, [
+            {'id': self.question.pk, 'text': 'Renamed', 'options': [
+                {'id': self.right.pk, 'text': 'Right', 'is_correct': True},
+            ]},
+            {'text': 'New question', 'options': [{'text': 'New option', 'is_correct': True}]},
+        ])
+        self.assertEqual([question.text for question in compiled.questions], ['Renamed', 'New question'])
+        self.assertFalse(Option.objects.filter(pk=self.wrong.pk).exists())
+        self.assertEqual(Question.objects.filter(quiz=self.quiz).count(), 2)
+        self.assertTrue(Option.objects.filter(pk=self.foreign_option.pk).exists())
+
+    def test_ids_from_another_quiz_or_question_are_refused(self):
+        trees = {
+            'foreign question': [{'id': self.foreign_question.pk, 'text': 'Stolen', 'options': [
+                {'text': 'Option', 'is_correct': True},
+            ]}],
+            'foreign option': [{'id': self.question.pk, 'text': 'Question', 'options': [
+                {'id': self.foreign_option.pk, 'text': 'Stolen', 'is_correct': True},
+            ]}],
+            'option under another question': [
+                {'id': self.question.pk, 'text': 'Question', 'options': [{'text': 'Option', 'is_correct': True}]},
+                {'text': 'New question', 'options': [{'id': self.right.pk, 'text': 'Moved', 'is_correct': True}]},
+            ],
+        }
+        for label, tree in trees.items():
+            with self.subTest(label):
+                with self.assertRaises(ValueError):
+                    save_quiz_tree(self.quiz.pk, tree)
+        # Every refused tree rolled back as a whole
+        self.foreign_question.refresh_from_db()
+        self.foreign_option.refresh_from_db()
+        self.assertEqual(self.foreign_question.text, 'Question 0')
+        self.assertEqual(self.foreign_option.text, 'Right')
+        self.assertEqual(set(Option.objects.filter(question=self.question)), {self.right, self.wrong})
+
+    def test_tree_endpoint_is_admin_only_and_validates(self):
+        url = f'/api/quizzes/{self.quiz.pk}/tree/'
+        tree = {'questions': [{'text': 'Question', 'options': [{'text': 'Option', 'is_correct': True}]}]}
+        self.client.force_login(User.objects.create_user('player', password='x'))
+        self.assertEqual(self.client.put(url, tree, content_type='application/json').status_code, 403)
+
+        self.client.force_login(User.objects.create_user('admin', password='x', is_staff=True))
+        no_answer = {'questions': [{'text': 'Question', 'options': [{'text': 'Option'}]}]}
+        foreign = {'questions': [{'id': self.foreign_question.pk, 'text': 'Stolen', 'options': [
+            {'text': 'Option', 'is_correct': True},
+        ]}]}
+        for payload in [no_answer, foreign]:
+            with self.subTest(payload=payload):
+                self.assertEqual(self.client.put(url, payload, content_type='application/json').status_code, 400)
+        self.assertEqual(self.client.put(url, tree, content_type='application/json').status_code, 200)
+        self.assertFalse(Question.objects.filter(pk=self.question.pk).exists())
+
+
+# 📦 Data exports
+
+class ExportTests(TestCase):
+    """Exports are staff-only and stream every row, oldest id first."""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('alice', password='x')
+        player = PlayerProfile.objects.get(user=user)
+        cls.item = ShopItem.objects.create(name='Streak freeze', description='Keeps a streak', price=10)
+        cls.purchases = [Purchase.objects.create(player=player, item=cls.item) for _ in range(3)]
+        LeaderboardEntry.objects.create(name='alice', score=30)
+        cls.staff = User.objects.create_user('staff', password='x', is_staff=True)
+
+    def export(self, name, **params):
+        response = self.client.get(reverse('export_data', args=[name]), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_only_staff_can_export(self):
+        url = reverse('export_data', args=['purchases'])
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(User.objects.get(username='alice'))
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+    def test_ndjson_export_with_since_id(self):
+        self.client.force_login(self.staff)
+        rows = [json.loads(line) for line in self.export('purchases').splitlines()]
+        self.assertEqual([row['id'] for row in rows], [purchase.pk for purchase in self.purchases])
+        self.assertEqual(rows[0]['player__user__username'], 'alice')
+        self.assertEqual(rows[0]['item__price'], 10)
+        newer = self.export('purchases', since_id=self.purchases[0].pk).splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in newer], [purchase.pk for purchase in self.purchases[1:]])
+
+    def test_csv_export(self):
+        self.client.force_login(self.staff)
+        lines = list(csv.reader(self.export('leaderboard', format='csv').splitlines()))
+        self.assertEqual(lines, [['id', 'name', 'score'], [str(LeaderboardEntry.objects.get().pk), 'alice', '30']])
+
+    def test_bad_requests(self):
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get(reverse('export_data', args=['users'])).status_code, 404)
+        for params in [{'format': 'xml'}, {'since_id': 'abc'}, {'since': 'yesterday'}]:
+            with self.subTest(params=params):
+                response = self.client.get(reverse('export_data', args=['purchases']), params)
+                self.assertEqual(response.status_code, 400)
+        # The leaderboard has no timestamp to filter on
+        response = self.client.get(reverse('export_data', args=['leaderboard']), {'since': '2026-01-01T00:00:00'})
+        self.assertEqual(response.status_code, 400)
+
+
+# 📦 Deferred jobs
+
+class DeferredJobTests(TestCase):
+    """Quiz completion jobs: retry backoff and the streak update they apply."""
+
+    def setUp(self):
+        user = User.objects.create_user('alice', password='x')
+        self.profile = PlayerProfile.objects.get(user=user)
+        self.course = Course.objects.create(title='Python', description='Basics')
+        enqueue_quiz_completion(self.profile, self.course)
+
+    def test_failed_job_waits_for_its_retry_delay(self):
+        with mock.patch.dict(JOB_HANDLERS, quiz_completion=mock.Mock(side_effect=OperationalError('database is locked'))):
+            call_command('process_deferred_jobs', stdout=StringIO())
+        job = DeferredJob.objects.get()
+        self.assertEqual(job.attempts, 1)
+        self.assertIsNone(job.failed_at)
+        self.assertGreater(job.next_attempt_at, timezone.now())
+
+        # Not due yet, so nothing runs
+        self.assertEqual(process_pending_jobs(), (0, 0))
+
+        DeferredJob.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(process_pending_jobs(), (1, 0))
+        self.assertTrue(CompletedQuiz.objects.filter(player=self.profile, course=self.course).exists())
+
+    def test_streak_notices_are_shown_on_the_next_page(self):
+        today = timezone.localdate()
+        PlayerProfile.objects.filter(pk=self.profile.pk).update(
+            streak_freeze_count=1, current_streak=4, last_activity_date=today - timedelta(days=2)
+        )
+        DeferredJob.objects.update(activity_date=today)
+        self.assertEqual(process_pending_jobs(), (1, 0))
+        self.client.force_login(self.profile.user)
+        shown = [str(message) for message in self.client.get(reverse('home')).context['messages']]
+        self.assertEqual(shown, ["❄️ Streak freeze used! Your streak continues."])
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.pending_notices, [])
+        self.assertEqual(self.profile.current_streak, 5)
+
+    def test_streak_update_keeps_a_concurrent_freeze_purchase(self):
+        stale = PlayerProfile.objects.get(pk=self.profile.pk)
+        # A purchase lands after the job's copy of the profile was loaded
+        PlayerProfile.objects.filter(pk=self.profile.pk).update(streak_freeze_count=F('streak_freeze_count') + 1)
+        record_quiz_completion(stale, self.course)
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.streak_freeze_count, 1)
+        self.assertEqual(self.profile.current_streak, 1)
+
+
+# 📦 Leaderboard cursors
+
+class LeaderboardCursorTests(TestCase):
+    """A cursor from a board with another tie-break key restarts at the top page."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('alice', password='x')
+        self.course = Course.objects.create(title='Python', description='Basics')
+        self.client.force_login(self.user)
+
+    def test_string_key_cursor_on_player_keyed_boards(self):
+        cursor = encode_cursor(10, 'alice', 1)
+        self.assertIsNone(decode_cursor(cursor, int))
+        for url in [
+            reverse('leaderboard_window', args=['daily']),
+            '/api/leaderboard-entries/window/daily/',
+            reverse('course_leaderboard', args=[self.course.pk]),
+        ]:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url, {'after': cursor}).status_code, 200)
+
+    def test_integer_key_cursor_on_the_all_time_board(self):
+        cursor = encode_cursor(10, 7, 1)
+        self.assertIsNone(decode_cursor(cursor, str))
+        self.assertEqual(self.client.get(reverse('leaderboard'), {'after': cursor}).status_code, 200)
+
+
+# 📦 Response cache
+
+class CacheViewTests(TestCase):
+    """cache_view shares only anonymous responses that carry no per-visitor state."""
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.calls = 0
+
+    def cached_view(self, prepare=lambda request, response: None):
+        @cache_view(key_prefix='test')
+        def view(request):
+            self.calls += 1
+            response = HttpResponse(f'call {self.calls}')
+            prepare(request, response)
+            return response
+        return view
+
+    def get(self, view, user=None):
+        request = self.factory.get('/cached/')
+        request.user = user or AnonymousUser()
+        request.session = SessionStore()
+        return view(request)
+
+    def test_anonymous_response_is_cached_without_cookies(self):
+        view = self.cached_view()
+        self.get(view)
+        response = self.get(view)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(response.content, b'call 1')
+        self.assertFalse(response.cookies)
+
+    def test_response_setting_a_cookie_is_not_cached(self):
+        view = self.cached_view(lambda request, response: response.set_cookie('seen', '1'))
+        self.get(view)
+        self.get(view)
+        self.assertEqual(self.calls, 2)
+
+    def test_response_with_a_csrf_token_is_not_cached(self):
+        view = self.cached_view(lambda request, response: get_token(request))
+        self.get(view)
+        self.get(view)
+        self.assertEqual(self.calls, 2)
+
+    def test_response_touching_the_session_is_not_cached(self):
+        view = self.cached_view(lambda request, response: request.session.__setitem__('visited', True))
+        self.get(view)
+        self.get(view)
+        self.assertEqual(self.calls, 2)
+
+    def test_authenticated_users_never_read_or_fill_the_cache(self):
+        user = User.objects.create_user('alice', password='x')
+        view = self.cached_view()
+        self.assertEqual(self.get(view, user).content, b'call 1')
+        self.assertEqual(self.get(view).content, b'call 2')
+        self.assertEqual(self.get(view, user).content, b'call 3')
+        self.assertEqual(self.get(view).content, b'call 2')
+
+
+# 📦 Conditional GETs
+
+class ConditionalGetTests(TestCase):
+    """Catalog pages answer 304 for current copies, and per-user changes give a new ETag."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('alice', password='x')
+        self.profile = PlayerProfile.objects.get(user=self.user)
+        self.course = Course.objects.create(title='Python', description='Basics')
+        self.url = reverse('course_list')
+
+    def revalidate(self, etag):
+        return self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_repeat_request_gets_304(self):
+        for signed_in in [False, True]:
+            with self.subTest(signed_in=signed_in):
+                if signed_in:
+                    self.client.force_login(self.user)
+                etag = self.client.get(self.url)['ETag']
+                response = self.revalidate(etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b'')
+
+    def test_signed_in_pages_have_no_last_modified(self):
+        self.assertTrue(self.client.get(self.url).has_header('Last-Modified'))
+        self.client.force_login(self.user)
+        response = self.client.get(self.url)
+        self.assertTrue(response.has_header('ETag'))
+        self.assertFalse(response.has_header('Last-Modified'))
+
+    def test_point_change_gives_a_new_etag(self):
+        self.client.force_login(self.user)
+        etag = self.client.get(self.url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            credit_points(self.profile, 50)
+        response = self.revalidate(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_pending_messages_force_a_full_render(self):
+        self.client.force_login(self.user)
+        etag = self.client.get(self.url)['ETag']
+        item = ShopItem.objects.create(name='Streak freeze', description='Keeps a streak', price=10)
+        # Using an item the player does not own leaves an error message behind
+        self.client.get(reverse('use_item', args=[item.pk]))
+        response = self.revalidate(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['messages']), 1)
+
+
+# 📦 Cache generations
+
+class CacheGenerationTests(TestCase):
+    """Generation keys never expire, however often they are bumped."""
+
+    def test_bumped_generation_is_stored_without_timeout(self):
+        bump_generation('course:1')
+        first = get_generations('course:1')['course:1']
+        with mock.patch.object(cache, 'set', wraps=cache.set) as cache_set:
+            bump_generation('course:1')
+        cache_set.assert_called_once()
+        self.assertIsNone(cache_set.call_args.args[2])
+        self.assertNotEqual(get_generations('course:1')['course:1'], first)
+
+    def test_point_and_streak_changes_bump_the_user_generation_on_commit(self):
+        user = User.objects.create_user('alice', password='x')
+        profile = PlayerProfile.objects.get(user=user)
+        course = Course.objects.create(title='Python', description='Basics')
+        namespace = user_namespace(user.pk)
+        for change in [lambda: credit_points(profile, 10), lambda: record_quiz_completion(profile, course)]:
+            before = get_generations(namespace)[namespace]
+            with self.captureOnCommitCallbacks(execute=True):
+                change()
+                # Still the old generation while the transaction is open
+                self.assertEqual(get_generations(namespace)[namespace], before)
+            self.assertNotEqual(get_generations(namespace)[namespace], before)
+
+    def test_course_and_shop_edits_bump_their_generation_on_commit(self):
+        course = Course.objects.create(title='Python', description='Basics')
+        item = ShopItem.objects.create(name='Streak freeze', description='Keeps a streak', price=10)
+        for namespace, instance in [(course_namespace(course.pk), course), (SHOP_NAMESPACE, item)]:
+            before = get_generations(namespace)[namespace]
+            with self.captureOnCommitCallbacks(execute=True):
+                instance.save()
+                self.assertEqual(get_generations(namespace)[namespace], before)
+            self.assertNotEqual(get_generations(namespace)[namespace], before)
+
+    @override_settings(CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'two-tier-shared'},
+    })
+    def test_bumped_generation_reaches_other_workers_within_the_stamp_interval(self):
+        now = [1000.0]
+        with mock.patch('courses.cache_backends.time.monotonic', side_effect=lambda: now[0]):
+            workers = [TwoTierCache('', {'OPTIONS': {'SHARED_ALIAS': 'shared'}}) for _ in range(2)]
+            workers[0].set('gen:course:1', 1, None)
+            workers[1].set('course:1:1.1:page', 'old page')
+            self.assertEqual(workers[1].get('gen:course:1'), 1)
+            workers[0].set('gen:course:1', 2, None)
+            # Served from the local tier until STAMP_CHECK_INTERVAL has passed
+            self.assertEqual(workers[1].get('gen:course:1'), 1)
+            now[0] += workers[1].stamp_check_interval + 0.1
+            self.assertEqual(workers[1].get('gen:course:1'), 2)
+            # Other keys keep the full LOCAL_TIMEOUT
+            self.assertEqual(workers[1].get('course:1:1.1:page'), 'old page')
+
+    @override_settings(CACHES={
+        'default': {'BACKEND': 'courses.cache_backends.TwoTierCache', 'OPTIONS': {'SHARED_ALIAS': 'shared'}},
+        'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'two-tier-shared'},
+    })
+    def test_warm_leaderboard_read_skips_the_shared_tier(self):
+        compute = mock.Mock(return_value=['alice'])
+        get_or_compute_leaderboard(compute)
+        before = caches['default'].stats()
+        self.assertEqual(get_or_compute_leaderboard(compute), ['alice'])
+        after = caches['default'].stats()
+        compute.assert_called_once()
+        self.assertEqual((after['shared_hits'], after['misses']), (before['shared_hits'], before['misses']))
+        self.assertGreater(after['local_hits'], before['local_hits'])
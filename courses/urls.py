@@ -1,8 +1,8 @@
-from django.urls import path
+from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 from . import views
 
-# DRF API-reititin
+# DRF API-reititin (read-only viewsets; no emails or answer keys in the output)
 router = DefaultRouter()
 router.register(r'profiles', views.ProfileViewSet)
 router.register(r'courses', views.CourseViewSet)
@@ -26,10 +26,17 @@ urlpatterns = [
     path('profile/<str:username>/', views.view_profile, name='view_profile'),
     path('use-item/<int:item_id>/', views.use_item, name='use_item'),
     path('quiz/<int:course_id>/<int:question_number>/', views.quiz_view, name='quiz'),
+    path('quiz/<int:course_id>/all/', views.quiz_submit, name='quiz_submit'),
     path('login/', views.sign_in_view, name='sign_in'),
     path('complete-course/', views.complete_course, name='complete_course'),
     path('leaderboard/', views.leaderboard, name='leaderboard'),
+    path('leaderboard/<str:window>/', views.leaderboard_window, name='leaderboard_window'),
+    path('leaderboard/course/<int:course_id>/', views.course_leaderboard, name='course_leaderboard'),
+    path('leaderboard/level/<str:level>/', views.level_leaderboard, name='level_leaderboard'),
     path('not_signed_in/', views.not_signed_in, name='not_signed_in'),
     path('settings/', views.settings_view, name='settings'),
+    path('cache-stats/', views.cache_stats, name='cache_stats'),
+    path('export/<str:name>/', views.export_data, name='export_data'),
+    path('api/', include(router.urls)),
 ]
 
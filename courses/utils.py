@@ -1,49 +1,421 @@
 """
 Utility functions for the courses app.
 """
+from django.conf import settings
+from django.contrib import messages
 from django.core.cache import cache
-from django.db import models
+from django.db import models, transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
 from functools import wraps
+import hashlib
 import logging
+import math
+import random
+import time
 
 logger = logging.getLogger(__name__)
 
+# Namespace whose generation is part of every versioned key
+GLOBAL_NAMESPACE = 'global'
 
-def cache_view(timeout=300, key_prefix=''):
+# Namespace covering every page that lists courses
+CATALOG_NAMESPACE = 'catalog'
+
+# Namespace covering everything rendered from shop items
+SHOP_NAMESPACE = 'shop'
+
+# How long and how often get_or_compute() waits for another process's result
+SINGLE_FLIGHT_MAX_WAIT = 2.0
+SINGLE_FLIGHT_POLL_INTERVAL = 0.05
+
+
+def _generation_key(namespace):
+    return f'gen:{namespace}'
+
+
+def _new_generation():
+    # Time-based, so a generation key that was evicted never restarts at a
+    # value that older cache entries were stored under
+    return time.time_ns() // 1000
+
+
+def get_generations(*namespaces):
+    """
+    Get the current generation numbers of cache namespaces.
+
+    Args:
+        namespaces: Namespace names, e.g. 'global', 'user:5', 'course:3'
+
+    Returns:
+        Dict mapping namespace to its generation number
+    """
+    keys = {_generation_key(namespace): namespace for namespace in namespaces}
+    found = cache.get_many(list(keys))
+    generations = {keys[key]: value for key, value in found.items()}
+    for key, namespace in keys.items():
+        if namespace not in generations:
+            cache.add(key, _new_generation(), None)
+            generations[namespace] = cache.get(key)
+    return generations
+
+
+def bump_generation(namespace):
+    """
+    Invalidate every key built from a namespace in O(1).
+
+    Nothing is deleted: keys from older generations are simply never read
+    again and age out of the cache on their own.
+
+    Args:
+        namespace: Namespace to invalidate
+    """
+    # A fresh time-based value rather than cache.incr(): the database
+    # backend's incr re-sets the key with the default timeout, which would
+    # expire the generation and empty the namespace again minutes later
+    cache.set(_generation_key(namespace), _new_generation(), None)
+    logger.debug(f"Bumped cache generation for {namespace}")
+
+
+def versioned_key(namespace, *parts):
+    """
+    Build a cache key that changes whenever its namespace or the global
+    namespace is invalidated.
+
+    Args:
+        namespace: Namespace the key belongs to
+        parts: Further key components
+
+    Returns:
+        Cache key string
+    """
+    generations = get_generations(GLOBAL_NAMESPACE, namespace)
+    suffix = ':'.join(str(part) for part in parts)
+    return f"{namespace}:{generations[GLOBAL_NAMESPACE]}.{generations[namespace]}:{suffix}"
+
+
+def user_namespace(user_id):
+    return f'user:{user_id}'
+
+
+def course_namespace(course_id):
+    return f'course:{course_id}'
+
+
+def leaderboard_namespace(board=None):
+    return f"leaderboard:{board or 'all-time'}"
+
+
+# Response headers that are replayed from a cached response; everything
+# else (Set-Cookie in particular) is dropped
+CACHED_RESPONSE_HEADERS = ('Content-Type', 'Content-Language', 'Vary', 'ETag', 'Last-Modified')
+
+
+def _response_cache_key(request, namespace, key_prefix, vary_on):
+    """Cache key for a request: method, path, normalised query and Vary header values."""
+    query = sorted(
+        (name, value)
+        for name in request.GET
+        for value in request.GET.getlist(name)
+    )
+    varies = [request.headers.get(header, '') for header in vary_on]
+    digest = hashlib.md5(
+        repr((request.method, request.path, query, varies)).encode()
+    ).hexdigest()
+    return versioned_key(namespace, 'response', key_prefix, digest)
+
+
+def _is_cacheable(request, response, vary_on):
+    """Whether a rendered response is safe to share with other visitors."""
+    if response.status_code != 200 or response.streaming or response.cookies:
+        return False
+    # A rendered {% csrf_token %} or a touched session is per-visitor state
+    if request.META.get('CSRF_COOKIE_NEEDS_UPDATE'):
+        return False
+    session = getattr(request, 'session', None)
+    if session is not None and session.modified:
+        return False
+    cache_control = response.get('Cache-Control', '')
+    if 'private' in cache_control or 'no-store' in cache_control:
+        return False
+    # Only cache if every header the response varies on is part of the key
+    # (Cookie is fine: only anonymous requests are cached)
+    allowed = {header.lower() for header in vary_on} | {'cookie'}
+    varies = {header.strip().lower() for header in response.get('Vary', '').split(',') if header.strip()}
+    return varies <= allowed
+
+
+def cache_view(timeout=300, key_prefix='', namespace=GLOBAL_NAMESPACE, vary_on=('Accept-Language',)):
     """
-    Decorator to cache view results.
+    Decorator to cache the rendered response of a view for anonymous visitors.
+    
+    Only GET/HEAD requests from anonymous users without pending flash
+    messages are served from or stored in the cache. The key covers the
+    method, path, sorted query string and the ``vary_on`` request headers,
+    and only the rendered bytes plus a few safe headers are stored, never
+    cookies. Responses that set cookies, render a CSRF token or modify the
+    session are not cached.
     
     Args:
         timeout: Cache timeout in seconds (default: 5 minutes)
-        key_prefix: Prefix for cache key
+        key_prefix: Prefix for cache key (default: the view's name)
+        namespace: Cache namespace whose invalidation drops these responses,
+            or a callable taking the view's arguments and returning one
+        vary_on: Request headers the response depends on
     """
     def decorator(view_func):
         @wraps(view_func)
         def wrapper(request, *args, **kwargs):
-            # Create cache key based on request path and user
-            user_id = request.user.id if request.user.is_authenticated else 'anonymous'
-            cache_key = f"{key_prefix}_{view_func.__name__}_{request.path}_{user_id}"
+            if (request.method not in ('GET', 'HEAD') or request.user.is_authenticated
+                    or len(messages.get_messages(request))):
+                return view_func(request, *args, **kwargs)
+
+            key_namespace = namespace(request, *args, **kwargs) if callable(namespace) else namespace
+            cache_key = _response_cache_key(
+                request, key_namespace, key_prefix or view_func.__name__, vary_on
+            )
             
             # Try to get from cache
-            cached_result = cache.get(cache_key)
-            if cached_result is not None:
+            cached = cache.get(cache_key)
+            if cached is not None:
                 logger.debug(f"Cache hit for {cache_key}")
-                return cached_result
+                status, headers, content = cached
+                response = HttpResponse(content, status=status)
+                for header, value in headers:
+                    response[header] = value
+                return response
             
-            # Execute view and cache result
-            result = view_func(request, *args, **kwargs)
-            cache.set(cache_key, result, timeout)
-            logger.debug(f"Cached result for {cache_key}")
+            # Execute view and cache the rendered bytes
+            response = view_func(request, *args, **kwargs)
+            if hasattr(response, 'render') and callable(response.render):
+                response.render()
+            if _is_cacheable(request, response, vary_on):
+                headers = [
+                    (header, response[header])
+                    for header in CACHED_RESPONSE_HEADERS
+                    if response.has_header(header)
+                ]
+                cache.set(cache_key, (response.status_code, headers, response.content), timeout)
+                logger.debug(f"Cached response for {cache_key}")
             
-            return result
+            return response
+        return wrapper
+    return decorator
+
+
+def _conditional_validators(request, version, last_modified, per_user):
+    """Build the strong ETag and Last-Modified timestamp for a response."""
+    parts = [
+        str(version),
+        request.get_full_path(),
+        request.headers.get('Accept', ''),
+        request.headers.get('Accept-Language', ''),
+    ]
+    user = request.user
+    if user.is_authenticated:
+        # The body also shows per-user state and, in forms, a CSRF token
+        # tied to the CSRF cookie, so both go into the ETag
+        parts.append(str(user.pk))
+        if per_user:
+            from .context_processors import active_effects
+            namespace = user_namespace(user.pk)
+            parts.append(str(get_generations(namespace)[namespace]))
+            parts.append(request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''))
+            parts.append(''.join(active_effects(request)['active_effects']))
+        # Last-Modified only covers the shared content, so it would let a
+        # client keep a stale per-user page
+        last_modified = None
+    etag = '"%s"' % hashlib.sha1('|'.join(parts).encode()).hexdigest()
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    return etag, timestamp
+
+
+def conditional_get(request, version, last_modified, get_response, per_user=True):
+    """
+    Answer a GET with 304 Not Modified if the client's copy is current.
+    
+    The validators are computed before ``get_response`` runs, so an
+    unchanged page costs no template rendering or serialization.
+    
+    Args:
+        request: Incoming request
+        version: Value that changes whenever the content changes
+        last_modified: Datetime of the newest content change, or None
+        get_response: Zero-argument callable producing the full response
+        per_user: Whether the page also shows the user's points, effects
+            or forms, so that changes to those change the ETag
+        
+    Returns:
+        A 304 response, or the response from ``get_response`` with ETag,
+        Last-Modified and Cache-Control headers added
+    """
+    etag, timestamp = _conditional_validators(request, version, last_modified, per_user)
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = get_response()
+        if response.status_code != 200:
+            return response
+    response['ETag'] = etag
+    if timestamp is not None:
+        response['Last-Modified'] = http_date(timestamp)
+    # Let browsers keep the page but always revalidate it
+    if request.user.is_authenticated:
+        patch_cache_control(response, no_cache=True, private=True)
+    else:
+        patch_cache_control(response, no_cache=True)
+    return response
+
+
+def conditional_view(content_version, per_user=True):
+    """
+    Decorator answering conditional GETs for a view.
+    
+    Pages showing Django messages are always rendered in full, since a
+    message is shown once.
+    
+    Args:
+        content_version: Callable taking the view's arguments and returning
+            ``(version, last_modified)`` for the content the view renders
+        per_user: See conditional_get()
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or len(messages.get_messages(request)):
+                return view_func(request, *args, **kwargs)
+            version, last_modified = content_version(request, *args, **kwargs)
+            return conditional_get(
+                request, version, last_modified,
+                lambda: view_func(request, *args, **kwargs),
+                per_user=per_user,
+            )
         return wrapper
     return decorator
 
 
+def iter_pk_batches(queryset, batch_size, *fields):
+    """
+    Read a queryset in primary key order, one batch at a time.
+
+    Each batch starts after the last primary key of the previous one, so
+    every batch is an index range scan, however deep into the table it is.
+
+    Args:
+        queryset: Queryset to read
+        batch_size: Maximum number of rows per batch
+        fields: Further fields to read besides the primary key
+
+    Yields:
+        Lists of ``(pk, *fields)`` tuples
+    """
+    last_pk = None
+    while True:
+        batch = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        rows = list(batch.order_by('pk').values_list('pk', *fields)[:batch_size])
+        if not rows:
+            return
+        last_pk = rows[-1][0]
+        yield rows
+
+
+def create_user_profiles(user_ids):
+    """
+    Create the Profile and PlayerProfile rows for users that lack them.
+    
+    Uses one INSERT per table with conflicts ignored, so it is safe to call
+    for users that already have profiles and for any number of users.
+    
+    Args:
+        user_ids: Primary keys of the users
+    """
+    from .models import Profile, PlayerProfile
+    for model in (Profile, PlayerProfile):
+        model.objects.bulk_create([model(user_id=user_id) for user_id in user_ids], ignore_conflicts=True)
+
+
+def bulk_create_users(users, batch_size=None):
+    """
+    Bulk-create users together with their profiles.
+    
+    ``User.objects.bulk_create()`` sends no post_save signals, so mass user
+    creation (imports, seeding) should go through this instead.
+    
+    Args:
+        users: Unsaved User instances
+        batch_size: Rows per INSERT (default: all at once)
+        
+    Returns:
+        The created User instances
+    """
+    from django.contrib.auth.models import User
+    created = User.objects.bulk_create(users, batch_size=batch_size)
+    user_ids = [user.pk for user in created]
+    if None in user_ids:
+        # Backends that cannot return primary keys from a bulk insert
+        user_ids = list(
+            User.objects.filter(username__in=[user.username for user in created]).values_list('pk', flat=True)
+        )
+    create_user_profiles(user_ids)
+    return created
+
+
+def get_player_profile(user):
+    """
+    Look up a user's player profile without ever writing.
+    
+    Profiles are created at signup by the post_save signal and repaired
+    by ``manage.py backfill_player_profiles``, so read-only pages use this
+    instead of get_or_create(). Views should use ``request.player_profile``,
+    which calls this at most once per request.
+    
+    Args:
+        user: Django User instance
+        
+    Returns:
+        PlayerProfile instance or None if the user has none
+    """
+    from .models import PlayerProfile
+    profile = PlayerProfile.objects.select_related('user').filter(user=user).first()
+    if profile is None:
+        logger.warning(f"User {user.id} has no player profile; run backfill_player_profiles")
+    return profile
+
+
+def take_pending_notices(player_profile):
+    """
+    Remove and return the notices deferred jobs left for a player.
+
+    Costs nothing for a profile without notices; otherwise the notices are
+    read and cleared under a row lock, so none queued meanwhile are lost.
+
+    Args:
+        player_profile: PlayerProfile loaded for the current request
+
+    Returns:
+        List of notice strings, oldest first
+    """
+    if not player_profile.pending_notices:
+        return []
+    from .models import PlayerProfile
+    with transaction.atomic():
+        notices = (
+            PlayerProfile.objects.select_for_update()
+            .values_list('pending_notices', flat=True)
+            .get(pk=player_profile.pk)
+        )
+        PlayerProfile.objects.filter(pk=player_profile.pk).update(pending_notices=[])
+    player_profile.pending_notices = []
+    return notices
+
+
 def get_or_create_player_profile(user):
     """
     Get or create player profile with error handling.
     
+    Only for write paths that must not fail for a user missing a profile;
+    read-only pages use get_player_profile() instead.
+    
     Args:
         user: Django User instance
         
@@ -52,7 +424,7 @@ def get_or_create_player_profile(user):
     """
     try:
         from .models import PlayerProfile
-        profile, created = PlayerProfile.objects.get_or_create(user=user)
+        profile, created = PlayerProfile.objects.select_related('user').get_or_create(user=user)
         if created:
             logger.info(f"Created new player profile for user {user.username}")
         return profile
@@ -68,34 +440,118 @@ def invalidate_user_cache(user_id):
     Args:
         user_id: User ID to invalidate cache for
     """
-    # This is a simple implementation - in production you might want
-    # to use cache versioning or more sophisticated invalidation
-    cache.clear()
-    logger.info(f"Cleared cache for user {user_id}")
+    bump_generation(user_namespace(user_id))
+    logger.info(f"Invalidated cache for user {user_id}")
 
 
-def get_cached_leaderboard(timeout=300):
+def invalidate_course_cache(course_id):
     """
-    Get cached leaderboard data.
+    Invalidate all cache entries for a specific course.
     
     Args:
-        timeout: Cache timeout in seconds
+        course_id: Course ID to invalidate cache for
+    """
+    bump_generation(course_namespace(course_id))
+    bump_generation(CATALOG_NAMESPACE)
+
+
+def invalidate_shop_cache():
+    """Invalidate all cache entries built from shop items."""
+    bump_generation(SHOP_NAMESPACE)
+
+
+def invalidate_leaderboard_cache(board=None):
+    """
+    Invalidate the cached pages of a leaderboard.
+    
+    Args:
+        board: Leaderboard identifier, None for the all-time leaderboard
+    """
+    bump_generation(leaderboard_namespace(board))
+
+
+def _leaderboard_cache_key(board):
+    """Cache key of the top page of a leaderboard (None for the all-time board)."""
+    return versioned_key(leaderboard_namespace(board), 'top_page')
+
+
+def get_or_compute(key, compute, timeout=300, stale_timeout=None, lock_timeout=30, beta=1.0):
+    """
+    Get a cached value, recomputing it in at most one process at a time.
+    
+    Values are stored with the time their computation took. Shortly before
+    they expire, each reader may start a refresh early, with a probability
+    that rises as expiry approaches and with the cost of computing (XFetch),
+    so hot keys are usually refreshed before they ever go missing. Only the
+    reader holding a cache-based lock recomputes; everyone else keeps being
+    served the stale value. After a hard miss, readers that lose the lock
+    wait briefly for the winner's result before computing it themselves.
+    
+    Args:
+        key: Cache key
+        compute: Zero-argument callable producing the value
+        timeout: Seconds the value counts as fresh
+        stale_timeout: Extra seconds a stale value may be served while it is
+            being recomputed (default: same as timeout)
+        lock_timeout: Seconds after which an abandoned lock expires
+        beta: Early refresh eagerness; 0 disables early refresh
         
     Returns:
-        Cached leaderboard data or None
+        The cached or freshly computed value
     """
-    cache_key = 'leaderboard_data'
-    return cache.get(cache_key)
+    lock_key = f'{key}:lock'
+    envelope = cache.get(key)
+    if envelope is not None:
+        value, fresh_until, compute_time = envelope
+        # XFetch: -log(u) for u in (0, 1] is an exponentially distributed offset
+        jitter = compute_time * beta * -math.log(1.0 - random.random())
+        if time.time() + jitter < fresh_until:
+            return value
+        if not cache.add(lock_key, True, lock_timeout):
+            # Someone else is refreshing; serve what we have
+            return value
+        try:
+            return _compute_and_store(key, compute, timeout, stale_timeout)
+        finally:
+            cache.delete(lock_key)
+
+    if cache.add(lock_key, True, lock_timeout):
+        try:
+            return _compute_and_store(key, compute, timeout, stale_timeout)
+        finally:
+            cache.delete(lock_key)
+
+    # Another process is computing the value; give it a moment to finish
+    deadline = time.monotonic() + SINGLE_FLIGHT_MAX_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(SINGLE_FLIGHT_POLL_INTERVAL)
+        envelope = cache.get(key)
+        if envelope is not None:
+            return envelope[0]
+    logger.warning(f"Timed out waiting for {key} to be computed; computing it here")
+    return _compute_and_store(key, compute, timeout, stale_timeout)
 
 
-def set_cached_leaderboard(data, timeout=300):
+def _compute_and_store(key, compute, timeout, stale_timeout):
+    started = time.monotonic()
+    value = compute()
+    compute_time = time.monotonic() - started
+    stale_timeout = timeout if stale_timeout is None else stale_timeout
+    cache.set(key, (value, time.time() + timeout, compute_time), timeout + stale_timeout)
+    logger.debug(f"Computed {key} in {compute_time:.3f}s")
+    return value
+
+
+def get_or_compute_leaderboard(compute, timeout=300, board=None):
     """
-    Cache leaderboard data.
+    Get cached leaderboard data, computing it once across all workers on a miss.
     
     Args:
-        data: Leaderboard data to cache
+        compute: Zero-argument callable producing the leaderboard data
         timeout: Cache timeout in seconds
+        board: Leaderboard identifier, None for the all-time leaderboard
+        
+    Returns:
+        Leaderboard data
     """
-    cache_key = 'leaderboard_data'
-    cache.set(cache_key, data, timeout)
-    logger.debug("Cached leaderboard data")
+    return get_or_compute(_leaderboard_cache_key(board), compute, timeout)
@@ -1,5 +1,11 @@
 from django.contrib.auth.models import User
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.cache import caches
+from django.http import Http404, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404, redirect
+from django.urls import reverse
+from django.utils.dateparse import parse_datetime
+from django.utils.http import urlencode
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import authenticate, login
 from django.contrib import messages
@@ -7,31 +13,83 @@ from .models import (
     Profile, Course, Quiz, ShopItem, PlayerProfile, Purchase,
     CompletedQuiz, LeaderboardEntry, Question, Option, UserSettings
 )
-from datetime import date, timedelta
+from .attempts import advance_attempt, finish_attempt, load_attempt, result_token, start_attempt
+from .exports import EXPORT_FORMATS, EXPORTS, export_rows, render_export
 from .forms import SignInForm
-from django.db.models import Count
+from .pagination import StableCursorPagination
+from .utils import (
+    CATALOG_NAMESPACE, cache_view, conditional_get, conditional_view, course_namespace,
+    get_or_create_player_profile, invalidate_user_cache,
+)
+from .jobs import enqueue_quiz_completion
+from .points import credit_points, debit_points
+from .quizzes import (
+    get_compiled_quiz, get_compiled_quizzes, points_for_correct_answers, save_quiz_tree, submit_quiz
+)
+from .leaderboard import (
+    PAGE_SIZE as LEADERBOARD_PAGE_SIZE, clamp_page_size, count_cohort_players,
+    count_window_players, course_cohort, get_cohort_page, get_cohort_rank,
+    get_neighbors, get_page as get_leaderboard_page, get_rank, get_window_page,
+    get_window_rank, level_cohort, period_start, record_points_change
+)
+from django.db.models import Count, F, Max, Q
+from functools import partial
 
 # DRF API ViewSetit
-from rest_framework import viewsets
-from rest_framework.permissions import IsAuthenticatedOrReadOnly
+# Querysets are fitted to the requested ?fields= and ?expand= (see
+# SparseFieldsMixin), so a list page costs a constant number of queries
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser, IsAuthenticated, IsAuthenticatedOrReadOnly
+from rest_framework.response import Response
 from .serializers import (
     ProfileSerializer, CourseSerializer, PlayerProfileSerializer, ShopItemSerializer,
     PurchaseSerializer, QuizSerializer, QuestionSerializer, OptionSerializer,
-    CompletedQuizSerializer, LeaderboardEntrySerializer
+    CompletedQuizSerializer, LeaderboardEntrySerializer, QuizSubmissionSerializer,
+    QuizTreeSerializer, RankedLeaderboardEntrySerializer, requested_expansions, requested_fields
 )
 
+# Entries shown above and below the player in the leaderboard "around me" mode
+AROUND_ME_SIZE = 5
+
+# Time-windowed leaderboards: URL name -> (score bucket period, heading)
+LEADERBOARD_WINDOWS = {
+    'daily': ('day', 'Today'),
+    'weekly': ('week', 'This Week'),
+    'monthly': ('month', 'This Month'),
+}
+
+# Content versions for conditional GETs: (version, last modified)
+
+def _row_version(model, pk):
+    try:
+        updated_at = model.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+    except (ValueError, TypeError):
+        # Malformed pk (e.g. /api/courses/abc/); the view's own lookup answers 404
+        return None, None
+    return updated_at, updated_at
+
+
+def _table_version(model):
+    # The row count catches deletions, which leave no newer updated_at behind
+    stats = model.objects.aggregate(latest=Max('updated_at'), count=Count('id'))
+    return f"{stats['count']}:{stats['latest']}", stats['latest']
+
+
 # 📦 HTML-based views (templates)
 
+@cache_view(timeout=300, namespace=CATALOG_NAMESPACE)
 def home(request):
     # Optimize: Only fetch courses that are needed for display
     courses = Course.objects.all()[:6]  # Limit to 6 courses for home page
     completed_courses = []
     player_profile = None
 
-    if request.user.is_authenticated:
+    # Loaded once per request by PlayerProfileMiddleware, without writing
+    if request.player_profile:
         try:
-            # Use get_or_create to handle missing PlayerProfile gracefully
-            player_profile, created = PlayerProfile.objects.get_or_create(user=request.user)
+            player_profile = request.player_profile
             # Optimize: Use select_related to reduce queries
             completed_courses = Course.objects.filter(
                 completedquiz__player=player_profile
@@ -50,15 +108,17 @@ def home(request):
     return render(request, 'home.html', context)
 
 
+@conditional_view(lambda request: _table_version(Course))
+@cache_view(timeout=600, namespace=CATALOG_NAMESPACE)
 def course_list(request):
     # Optimize: Use select_related for better performance
     courses = Course.objects.select_related('quiz').order_by('title')
     completed_course_ids = []
     player_profile = None
 
-    if request.user.is_authenticated:
+    if request.player_profile:
         try:
-            player_profile, created = PlayerProfile.objects.get_or_create(user=request.user)
+            player_profile = request.player_profile
             # Optimize: Use values_list to get only course IDs
             completed_course_ids = list(CompletedQuiz.objects.filter(
                 player=player_profile
@@ -76,17 +136,16 @@ def course_list(request):
     return render(request, 'course_list.html', context)
 
 
+@conditional_view(lambda request, pk: _row_version(Course, pk))
+@cache_view(timeout=600, namespace=lambda request, pk: course_namespace(pk))
 def course_detail(request, pk):
-    # Optimize: Use select_related and prefetch_related for better performance
-    course = get_object_or_404(
-        Course.objects.select_related('quiz').prefetch_related('quiz__questions__options'),
-        pk=pk
-    )
+    # The page only links to the quiz, so its questions are not loaded
+    course = get_object_or_404(Course.objects.select_related('quiz'), pk=pk)
     context = {'course': course}
     
     if request.user.is_authenticated:
         try:
-            player_profile, created = PlayerProfile.objects.get_or_create(user=request.user)
+            player_profile = request.player_profile
             context['player_profile'] = player_profile
         except Exception as e:
             import logging
@@ -96,21 +155,20 @@ def course_detail(request, pk):
     return render(request, 'course_detail.html', context)
 
 
+@cache_view(timeout=120, namespace=CATALOG_NAMESPACE)
 def course_search(request):
     query = request.GET.get('q')
     courses = Course.objects.filter(title__icontains=query) if query else Course.objects.all()
     context = {'courses': courses, 'query': query}
     if request.user.is_authenticated:
-        try:
-            context['player_profile'] = PlayerProfile.objects.get(user=request.user)
-        except PlayerProfile.DoesNotExist:
-            pass
+        context['player_profile'] = request.player_profile
     return render(request, 'course_search.html', context)
 
 
 @login_required(login_url='/login/')  # Use the correct login URL
+@conditional_view(lambda request: _table_version(ShopItem))
 def shop(request):
-    player_profile, created = PlayerProfile.objects.get_or_create(user=request.user)
+    player_profile = request.player_profile
     shop_items = ShopItem.objects.all()
     return render(request, 'shop.html', {
         'player_profile': player_profile,
@@ -132,27 +190,26 @@ def buy_item(request, item_id):
     item = get_object_or_404(ShopItem, pk=item_id)
     
     try:
-        player_profile, created = PlayerProfile.objects.get_or_create(user=request.user)
+        player_profile = request.player_profile or get_or_create_player_profile(request.user)
         
-        if player_profile.points >= item.price:
-            # Use atomic transaction to prevent race conditions
-            from django.db import transaction
-            with transaction.atomic():
-                player_profile.points -= item.price
-                
+        # The balance check and the debit are one conditional UPDATE
+        from django.db import transaction
+        with transaction.atomic():
+            balance = debit_points(player_profile, item.price)
+            if balance is not None:
                 # Only add to inventory, don't activate effects immediately
                 if "Streak freeze" in item.name:
-                    player_profile.streak_freeze_count += 1
-                    messages.success(request, f"Successfully purchased {item.name}! Added to inventory. Use it from your profile when needed.")
-                elif "Fired up streak" in item.name:
-                    messages.success(request, f"Successfully purchased {item.name}! Added to inventory. Use it from your profile when needed.")
-                elif "Experience festival" in item.name:
-                    messages.success(request, f"Successfully purchased {item.name}! Added to inventory. Use it from your profile when needed.")
-                else:
-                    messages.success(request, f"Successfully purchased {item.name}!")
-                
-                player_profile.save()
+                    PlayerProfile.objects.filter(pk=player_profile.pk).update(
+                        streak_freeze_count=F('streak_freeze_count') + 1
+                    )
                 Purchase.objects.create(player=player_profile, item=item)
+                record_points_change(player_profile, -item.price)
+
+        if balance is not None:
+            if any(name in item.name for name in ("Streak freeze", "Fired up streak", "Experience festival")):
+                messages.success(request, f"Successfully purchased {item.name}! Added to inventory. Use it from your profile when needed.")
+            else:
+                messages.success(request, f"Successfully purchased {item.name}!")
         else:
             messages.error(request, "You do not have enough points to buy this item.")
     except Exception as e:
@@ -166,28 +223,52 @@ def buy_item(request, item_id):
 
 @login_required
 def quiz_view(request, course_id, question_number=1):
-    # Optimize: Use select_related and prefetch_related for better performance
     course = get_object_or_404(Course.objects.select_related('quiz'), pk=course_id)
-    quiz = get_object_or_404(Quiz.objects.prefetch_related('questions__options'), course=course)
-    
-    # Optimize: Get questions with options in one query
-    questions = quiz.questions.select_related().prefetch_related('options').order_by('id')
-    total_questions = questions.count()
-    points_per_correct = 50
-
-    if 'score' not in request.session:
-        request.session['score'] = 0
+    if not hasattr(course, 'quiz') or question_number < 1:
+        raise Http404("No quiz found for this course")
+
+    # Questions, options and correct answers come from the compiled quiz cache
+    quiz = get_compiled_quiz(course.quiz.pk)
+    total_questions = len(quiz)
+
+    def question_url(number, token):
+        return f"{reverse('quiz', args=[course.id, number])}?{urlencode({'attempt': token})}"
+
+    # Progress lives in a signed attempt token rather than the session, so
+    # answering a question writes nothing until the quiz is completed
+    token = request.POST.get('attempt') or request.GET.get('attempt')
+    attempt = load_attempt(token, request.user, quiz)
+    if attempt is not None and 'result' in attempt:
+        # Result tokens of the whole-quiz form are not per-question attempts
+        attempt = None
+    if attempt is None:
+        if token:
+            messages.info(request, "Your quiz attempt expired or the quiz changed, so it was restarted.")
+        token, attempt = start_attempt(request.user, quiz)
+        if question_number != 1:
+            return redirect(question_url(1, token))
+    elif attempt['next'] != question_number:
+        # Keep the attempt on its own question; no skipping ahead or replaying
+        return redirect(question_url(attempt['next'], token))
 
     if question_number > total_questions:
-        score = request.session.get('score', 0)
-        gained_points = score * points_per_correct
-
-        if 'score' in request.session:
-            del request.session['score']
+        score = attempt['score']
+        gained_points = 0
 
         try:
-            player_profile, created = PlayerProfile.objects.get_or_create(user=request.user)
-            CompletedQuiz.objects.get_or_create(player=player_profile, course=course)
+            player_profile = request.player_profile or get_or_create_player_profile(request.user)
+            from django.db import transaction
+            with transaction.atomic():
+                # The claim commits with the points, so a replayed URL earns nothing
+                if finish_attempt(attempt):
+                    # Includes the experience festival multiplier if active
+                    gained_points = points_for_correct_answers(player_profile, score)
+                    if gained_points:
+                        credit_points(player_profile, gained_points)
+                        record_points_change(player_profile, gained_points, course=course)
+                    # Completion row and streak are applied by the job worker; its
+                    # streak notices are shown on the player's next page
+                    enqueue_quiz_completion(player_profile, course)
         except Exception as e:
             import logging
             logger = logging.getLogger(__name__)
@@ -195,42 +276,6 @@ def quiz_view(request, course_id, question_number=1):
             messages.error(request, "An error occurred while saving your progress.")
             return redirect('course_detail', pk=course_id)
 
-        # Streak handling: increment if last activity was yesterday or today; reset otherwise
-        today = date.today()
-        from django.utils import timezone
-        
-        # Check if streak should be maintained (normal logic or streak freeze)
-        should_maintain_streak = (
-            player_profile.last_activity_date in (today, today - timedelta(days=1)) or
-            (player_profile.streak_freeze_count > 0 and player_profile.last_activity_date == today - timedelta(days=2))
-        )
-        
-        if should_maintain_streak:
-            # Use streak freeze if needed
-            if (player_profile.streak_freeze_count > 0 and 
-                player_profile.last_activity_date == today - timedelta(days=2)):
-                player_profile.streak_freeze_count -= 1
-                messages.info(request, "❄️ Streak freeze used! Your streak continues.")
-            
-            # Apply fired up streak multiplier if active
-            streak_increment = 1
-            if (player_profile.fired_up_streak_until and 
-                timezone.now() < player_profile.fired_up_streak_until):
-                streak_increment = 3
-                messages.info(request, "🔥 Fired up streak active! +3 streak days!")
-            
-            player_profile.current_streak = (player_profile.current_streak or 0) + streak_increment
-        else:
-            player_profile.current_streak = 1
-            
-        if player_profile.current_streak > (player_profile.longest_streak or 0):
-            player_profile.longest_streak = player_profile.current_streak
-        player_profile.last_activity_date = today
-        player_profile.save()
-        
-        # Update leaderboard with new points
-        update_leaderboard_entry(player_profile)
-
         return render(request, 'quiz_complete.html', {
             'course': course,
             'score': score,
@@ -239,28 +284,12 @@ def quiz_view(request, course_id, question_number=1):
             'player_profile': player_profile,
         })
 
-    question = questions[question_number - 1]
+    question = quiz.question(question_number)
 
     if request.method == 'POST':
         selected_option_id = request.POST.get('selected_option')
-        correct_option = question.options.filter(is_correct=True).first()
-
-        if selected_option_id and correct_option and int(selected_option_id) == correct_option.id:
-            request.session['score'] += 1
-            player_profile = PlayerProfile.objects.get(user=request.user)
-            
-            # Apply experience festival multiplier if active
-            from django.utils import timezone
-            points_to_add = points_per_correct
-            if player_profile.experience_festival_until and timezone.now() < player_profile.experience_festival_until:
-                points_to_add *= 3
-            
-            player_profile.points += points_to_add
-            player_profile.save()
-            # Update leaderboard immediately when points are earned
-            update_leaderboard_entry(player_profile)
-
-        return redirect('quiz', course_id=course.id, question_number=question_number + 1)
+        token, attempt = advance_attempt(attempt, question.is_correct(selected_option_id))
+        return redirect(question_url(question_number + 1, token))
 
     return render(request, 'quiz.html', {
         'course': course,
@@ -268,7 +297,63 @@ def quiz_view(request, course_id, question_number=1):
         'question': question,
         'current_question_number': question_number,
         'total_questions': total_questions,
-        'player_profile': PlayerProfile.objects.get(user=request.user),
+        'score': attempt['score'],
+        'attempt_token': token,
+        'player_profile': request.player_profile,
+    })
+
+
+@login_required
+def quiz_submit(request, course_id):
+    """Show a whole quiz on one page and grade all answers in a single POST"""
+    course = get_object_or_404(Course.objects.select_related('quiz'), pk=course_id)
+    if not hasattr(course, 'quiz'):
+        raise Http404("No quiz found for this course")
+    quiz = get_compiled_quiz(course.quiz.pk)
+    attempt = load_attempt(request.POST.get('attempt') or request.GET.get('attempt'), request.user, quiz)
+
+    if request.method == 'POST':
+        if attempt is None or 'result' in attempt:
+            messages.info(request, "Your quiz attempt expired or the quiz changed, so it was restarted.")
+            return redirect('quiz_submit', course_id=course_id)
+        player_profile = request.player_profile or get_or_create_player_profile(request.user)
+        answers = {
+            question.id: request.POST.get(f'question_{question.id}')
+            for question in quiz.questions
+        }
+        try:
+            result = submit_quiz(player_profile, course, quiz, answers, attempt)
+        except Exception as e:
+            import logging
+            logger = logging.getLogger(__name__)
+            logger.error(f"Error in quiz submission for user {request.user.id}: {e}")
+            messages.error(request, "An error occurred while saving your progress.")
+            return redirect('course_detail', pk=course_id)
+        if result is None:
+            messages.info(request, "This quiz attempt was already submitted.")
+            return redirect('course_detail', pk=course_id)
+        for notice in result['notices']:
+            messages.info(request, notice)
+        # Redirect to the result, so reloading it does not resubmit the answers
+        token = result_token(attempt, {'score': result['score'], 'gained_points': result['gained_points']})
+        return redirect(f"{reverse('quiz_submit', args=[course_id])}?{urlencode({'attempt': token})}")
+
+    if attempt is not None and 'result' in attempt:
+        return render(request, 'quiz_complete.html', {
+            'course': course,
+            'score': attempt['result']['score'],
+            'total_questions': len(quiz),
+            'gained_points': attempt['result']['gained_points'],
+            'player_profile': request.player_profile,
+        })
+
+    token, _ = start_attempt(request.user, quiz)
+    return render(request, 'quiz_all.html', {
+        'course': course,
+        'quiz': quiz,
+        'questions': quiz.questions,
+        'total_questions': len(quiz),
+        'attempt_token': token,
     })
 
 
@@ -295,15 +380,15 @@ def create_profile(request):
             error_message = 'Email address is already registered.'
         else:
             try:
-                # Use atomic transaction to ensure data consistency
+                # Use atomic transaction to ensure data consistency; the
+                # post_save signal creates the profiles with the user
                 from django.db import transaction
                 with transaction.atomic():
-                    user = User.objects.create_user(
+                    User.objects.create_user(
                         username=username, 
                         email=email, 
                         password=password
                     )
-                    PlayerProfile.objects.create(user=user)
                 messages.success(request, 'Profile created successfully!')
                 return redirect('home')
             except Exception as e:
@@ -317,8 +402,12 @@ def create_profile(request):
 
 @login_required
 def view_profile(request, username):
-    user = get_object_or_404(User, username=username)
-    player_profile = get_object_or_404(PlayerProfile, user=user)
+    if request.user.is_authenticated and request.user.username == username and request.player_profile:
+        # Viewing your own profile: reuse the one loaded for this request
+        player_profile = request.player_profile
+    else:
+        player_profile = get_object_or_404(PlayerProfile.objects.select_related('user'), user__username=username)
+    user = player_profile.user
     # Group purchases by item to show quantities instead of duplicates
     inventory = (
         Purchase.objects
@@ -338,7 +427,9 @@ def view_profile(request, username):
 def use_item(request, item_id):
     """Use a consumable item from inventory"""
     item = get_object_or_404(ShopItem, pk=item_id)
-    player_profile = get_object_or_404(PlayerProfile, user=request.user)
+    player_profile = request.player_profile
+    if not player_profile:
+        raise Http404("No player profile found")
     
     # Check if user has this item
     if not Purchase.objects.filter(player=player_profile, item=item).exists():
@@ -352,7 +443,7 @@ def use_item(request, item_id):
     if "Streak freeze" in item.name:
         if player_profile.streak_freeze_count > 0:
             player_profile.streak_freeze_count -= 1
-            player_profile.save()
+            player_profile.save(update_fields=['streak_freeze_count'])
             # Remove one purchase record
             Purchase.objects.filter(player=player_profile, item=item).first().delete()
             messages.success(request, "❄️ Streak freeze activated! Your streak will be protected if you miss a day.")
@@ -360,19 +451,20 @@ def use_item(request, item_id):
             messages.error(request, "You don't have any streak freezes to use.")
     elif "Fired up streak" in item.name:
         player_profile.fired_up_streak_until = timezone.now() + timedelta(days=1)
-        player_profile.save()
+        player_profile.save(update_fields=['fired_up_streak_until'])
         # Remove one purchase record
         Purchase.objects.filter(player=player_profile, item=item).first().delete()
         messages.success(request, "🔥 Fired up streak activated! Your streak will be tripled for 24 hours!")
     elif "Experience festival" in item.name:
         player_profile.experience_festival_until = timezone.now() + timedelta(minutes=15)
-        player_profile.save()
+        player_profile.save(update_fields=['experience_festival_until'])
         # Remove one purchase record
         Purchase.objects.filter(player=player_profile, item=item).first().delete()
         messages.success(request, "🎉 Experience festival activated! You'll earn 3x points for 15 minutes!")
     else:
         messages.info(request, "This item doesn't have a special effect to use.")
     
+    invalidate_user_cache(request.user.id)
     return redirect('view_profile', username=request.user.username)
 
 
@@ -405,42 +497,135 @@ def complete_course(request):
         return redirect('leaderboard')
 
 
+def _top_leaderboard_page():
+    """Top leaderboard page and player count, shared by every visitor via the cache."""
+    from .utils import get_or_compute_leaderboard
+
+    def compute():
+        # The leaderboard is maintained incrementally by the write paths;
+        # full reconciliation is the offline sync_leaderboard command.
+        entries, next_cursor = get_leaderboard_page()
+        # The cached page is shared by everyone, so it holds no per-user data
+        return entries, next_cursor, LeaderboardEntry.objects.count()
+
+    return get_or_compute_leaderboard(compute)
+
+
 def leaderboard(request):
-    from .utils import get_cached_leaderboard, set_cached_leaderboard
-    
-    # Try to get cached leaderboard data
-    cached_data = get_cached_leaderboard()
-    if cached_data:
-        entries, user_position, total_players = cached_data
+    top_entries, top_next_cursor, total_players = _top_leaderboard_page()
+    top_score = top_entries[0].score if top_entries else 0
+    cursor = request.GET.get('after')
+    around_me = request.GET.get('around') == 'me' and request.user.is_authenticated
+
+    next_cursor = None
+    if around_me:
+        entries = get_neighbors(request.user.username, AROUND_ME_SIZE)
+    elif cursor:
+        entries, next_cursor = get_leaderboard_page(cursor)
     else:
-        # Sync leaderboard with current PlayerProfile data
-        sync_leaderboard()
-        entries = LeaderboardEntry.objects.order_by('-score', 'name')
-        
-        # Find current user's position if logged in
-        user_position = None
-        if request.user.is_authenticated:
-            try:
-                user_entry = entries.filter(name=request.user.username).first()
-                if user_entry:
-                    user_position = list(entries).index(user_entry) + 1
-            except Exception as e:
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.error(f"Error finding user position in leaderboard: {e}")
-        
-        total_players = entries.count()
-        
-        # Cache the result
-        set_cached_leaderboard((entries, user_position, total_players))
-    
+        entries, next_cursor = top_entries, top_next_cursor
+
+    # Rank is looked up per request for the current user only
+    user_position = None
+    if request.user.is_authenticated:
+        user_position = get_rank(request.user.username)
+
     return render(request, 'leaderboard.html', {
         'entries': entries,
         'user_position': user_position,
-        'total_players': total_players
+        'total_players': total_players,
+        'top_score': top_score,
+        'next_cursor': next_cursor,
+        'is_first_page': not cursor and not around_me,
+        'around_me': around_me,
     })
 
 
+def _ranked_board_context(request, board, get_board_page, count_players, get_player_rank, timeout=60):
+    """
+    Build the leaderboard.html context for a bucketed leaderboard.
+
+    The top page and player count are cached under the board's own key;
+    deeper pages are keyset scans, and the rank is looked up per user.
+    """
+    from .utils import get_or_compute_leaderboard
+
+    def compute():
+        top_entries, top_next_cursor = get_board_page()
+        return top_entries, top_next_cursor, count_players()
+
+    top_entries, top_next_cursor, total_players = get_or_compute_leaderboard(
+        compute, timeout=timeout, board=board
+    )
+
+    cursor = request.GET.get('after')
+    if cursor:
+        entries, next_cursor = get_board_page(cursor)
+    else:
+        entries, next_cursor = top_entries, top_next_cursor
+
+    user_position = None
+    if request.user.is_authenticated:
+        player_profile = request.player_profile
+        if player_profile:
+            user_position = get_player_rank(player_profile)
+
+    return {
+        'entries': entries,
+        'user_position': user_position,
+        'total_players': total_players,
+        'top_score': top_entries[0].score if top_entries else 0,
+        'next_cursor': next_cursor,
+        'is_first_page': not cursor,
+    }
+
+
+def leaderboard_window(request, window):
+    if window not in LEADERBOARD_WINDOWS:
+        raise Http404("Unknown leaderboard window")
+    period, board_label = LEADERBOARD_WINDOWS[window]
+
+    context = _ranked_board_context(
+        request,
+        f'{period}:{period_start(period).isoformat()}',
+        lambda cursor=None: get_window_page(period, cursor),
+        lambda: count_window_players(period),
+        lambda player_profile: get_window_rank(player_profile, period),
+    )
+    context.update({'window': window, 'board_label': board_label})
+    return render(request, 'leaderboard.html', context)
+
+
+def course_leaderboard(request, course_id):
+    course = get_object_or_404(Course.objects.only('id', 'title'), pk=course_id)
+    cohort = course_cohort(course.pk)
+    context = _ranked_board_context(
+        request,
+        cohort,
+        lambda cursor=None: get_cohort_page(cohort, cursor),
+        lambda: count_cohort_players(cohort),
+        lambda player_profile: get_cohort_rank(player_profile, cohort),
+    )
+    context['board_label'] = course.title
+    return render(request, 'leaderboard.html', context)
+
+
+def level_leaderboard(request, level):
+    levels = dict(Course._meta.get_field('level').choices)
+    if level not in levels:
+        raise Http404("Unknown course level")
+    cohort = level_cohort(level)
+    context = _ranked_board_context(
+        request,
+        cohort,
+        lambda cursor=None: get_cohort_page(cohort, cursor),
+        lambda: count_cohort_players(cohort),
+        lambda player_profile: get_cohort_rank(player_profile, cohort),
+    )
+    context['board_label'] = levels[level]
+    return render(request, 'leaderboard.html', context)
+
+
 @login_required
 def settings_view(request):
     # Ensure settings row exists
@@ -459,99 +644,295 @@ def settings_view(request):
 
 
 # 📦 REST API ViewSets (DRF)
+# All read-only: points, purchases and quizzes change only through the
+# service functions and the submit/tree actions, never by raw model writes.
+
+class SparseFieldsMixin:
+    """Defer the columns and skip the joins that ?fields= and ?expand= leave out."""
+
+    def get_queryset(self):
+        # The paginator reads the ordering columns of every row to build cursors
+        ordering = getattr(self, 'cursor_ordering', StableCursorPagination.ordering)
+        ordering = (ordering,) if isinstance(ordering, str) else ordering
+        return self.get_serializer_class().optimize_queryset(
+            super().get_queryset(), self.request, keep={field.lstrip('-') for field in ordering}
+        )
+
+
+class OwnerScopedMixin:
+    """Show a signed-in player only their own rows."""
+    # Lookup from the viewset's model to the owning User
+    owner_field = 'player__user'
 
-class ProfileViewSet(viewsets.ModelViewSet):
-    queryset = Profile.objects.all()
+    def get_queryset(self):
+        return super().get_queryset().filter(**{self.owner_field: self.request.user})
+
+
+class ProfileViewSet(SparseFieldsMixin, viewsets.ReadOnlyModelViewSet):
+    # Users without a settings row have the default, public visibility
+    queryset = Profile.objects.filter(
+        Q(user__settings__isnull=True) | Q(user__settings__profile_visibility='public')
+    )
     serializer_class = ProfileSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
 
 
-class CourseViewSet(viewsets.ModelViewSet):
+class ConditionalGetMixin:
+    """Answer conditional list and retrieve requests with 304 before serializing."""
+
+    def list(self, request, *args, **kwargs):
+        version, last_modified = _table_version(self.queryset.model)
+        return conditional_get(
+            request, version, last_modified,
+            partial(super().list, request, *args, **kwargs), per_user=False,
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        version, last_modified = _row_version(self.queryset.model, kwargs[self.lookup_url_kwarg or self.lookup_field])
+        if version is None:
+            # Unknown or malformed pk: let get_object() raise the 404
+            return super().retrieve(request, *args, **kwargs)
+        return conditional_get(
+            request, version, last_modified,
+            partial(super().retrieve, request, *args, **kwargs), per_user=False,
+        )
+
+
+class CourseViewSet(ConditionalGetMixin, SparseFieldsMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Course.objects.all()
     serializer_class = CourseSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
 
 
-class PlayerProfileViewSet(viewsets.ModelViewSet):
+class PlayerProfileViewSet(OwnerScopedMixin, SparseFieldsMixin, viewsets.ReadOnlyModelViewSet):
     queryset = PlayerProfile.objects.all()
     serializer_class = PlayerProfileSerializer
-    permission_classes = [IsAuthenticatedOrReadOnly]
+    permission_classes = [IsAuthenticated]
+    owner_field = 'user'
 
 
-class ShopItemViewSet(viewsets.ModelViewSet):
+class ShopItemViewSet(ConditionalGetMixin, SparseFieldsMixin, viewsets.ReadOnlyModelViewSet):
     queryset = ShopItem.objects.all()
     serializer_class = ShopItemSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
 
 
-class PurchaseViewSet(viewsets.ModelViewSet):
+class PurchaseViewSet(OwnerScopedMixin, SparseFieldsMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Purchase.objects.all()
     serializer_class = PurchaseSerializer
-    permission_classes = [IsAuthenticatedOrReadOnly]
+    permission_classes = [IsAuthenticated]
+    cursor_ordering = '-purchased_at'
 
 
-class QuizViewSet(viewsets.ModelViewSet):
+class QuizViewSet(SparseFieldsMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Quiz.objects.all()
     serializer_class = QuizSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
 
+    def get_serializer(self, *args, **kwargs):
+        # Fetch every listed quiz's compiled questions in one cache round trip
+        fields = requested_fields(self.request)
+        expanded = 'questions' in requested_expansions(self.request)
+        if kwargs.get('many') and args and expanded and (fields is None or 'questions' in fields):
+            quizzes = list(args[0])
+            args = (quizzes,) + args[1:]
+            context = kwargs.setdefault('context', self.get_serializer_context())
+            context['compiled_quizzes'] = get_compiled_quizzes([quiz.pk for quiz in quizzes])
+        return super().get_serializer(*args, **kwargs)
+
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
+    def attempt(self, request, pk=None):
+        """Start an attempt; pass the returned token to submit"""
+        quiz_obj = self.get_object()
+        token, _ = start_attempt(request.user, get_compiled_quiz(quiz_obj.pk))
+        return Response({'attempt': token})
+
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
+    def submit(self, request, pk=None):
+        """Grade all answers at once: {"attempt": "<token>", "answers": {"<question id>": <option id>}}"""
+        quiz_obj = self.get_object()
+        serializer = QuizSubmissionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        quiz = get_compiled_quiz(quiz_obj.pk)
+        attempt = load_attempt(serializer.validated_data['attempt'], request.user, quiz)
+        if attempt is None or 'result' in attempt:
+            raise ValidationError({'attempt': ["The attempt expired or the quiz changed; start a new one."]})
+        player_profile = request.player_profile or get_or_create_player_profile(request.user)
+        result = submit_quiz(
+            player_profile,
+            quiz_obj.course,
+            quiz,
+            serializer.validated_data['answers'],
+            attempt,
+        )
+        if result is None:
+            return Response({'detail': "This attempt was already submitted."}, status=status.HTTP_409_CONFLICT)
+        return Response({
+            'score': result['score'],
+            'total_questions': result['total_questions'],
+            'gained_points': result['gained_points'],
+            'results': {str(question_id): correct for question_id, correct in result['results'].items()},
+            'notices': result['notices'],
+            'points': player_profile.points,
+            'current_streak': player_profile.current_streak,
+        })
+
+    @action(detail=True, methods=['put'], permission_classes=[IsAdminUser])
+    def tree(self, request, pk=None):
+        """
+        Replace all questions and options in one request:
+        {"questions": [{"id"?, "text", "options": [{"id"?, "text", "is_correct"}]}]}
+        """
+        quiz_obj = self.get_object()
+        serializer = QuizTreeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            compiled = save_quiz_tree(quiz_obj.pk, serializer.validated_data['questions'])
+        except ValueError as e:
+            raise ValidationError({'questions': [str(e)]})
+        return Response({
+            'id': compiled.id,
+            'version': compiled.version,
+            'questions': compiled.questions_payload(),
+        })
+
 
-class QuestionViewSet(viewsets.ModelViewSet):
+class QuestionViewSet(SparseFieldsMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Question.objects.all()
     serializer_class = QuestionSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
 
 
-class OptionViewSet(viewsets.ModelViewSet):
+class OptionViewSet(SparseFieldsMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Option.objects.all()
     serializer_class = OptionSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
 
 
-class CompletedQuizViewSet(viewsets.ModelViewSet):
+class CompletedQuizViewSet(OwnerScopedMixin, SparseFieldsMixin, viewsets.ReadOnlyModelViewSet):
     queryset = CompletedQuiz.objects.all()
     serializer_class = CompletedQuizSerializer
-    permission_classes = [IsAuthenticatedOrReadOnly]
+    permission_classes = [IsAuthenticated]
+    cursor_ordering = '-completed_at'
 
 
-class LeaderboardEntryViewSet(viewsets.ModelViewSet):
+class LeaderboardEntryViewSet(SparseFieldsMixin, viewsets.ReadOnlyModelViewSet):
     queryset = LeaderboardEntry.objects.all()
     serializer_class = LeaderboardEntrySerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    # Scores change all the time, so the plain list pages by the unique
+    # name; ranked pages are the page/window/course/level actions
+    cursor_ordering = 'name'
+
+    @action(detail=False, methods=['get'])
+    def page(self, request):
+        """Keyset-paginated leaderboard: ?after=<cursor>&limit=<n>"""
+        entries, next_cursor = get_leaderboard_page(
+            request.query_params.get('after'),
+            request.query_params.get('limit', LEADERBOARD_PAGE_SIZE),
+        )
+        return Response({
+            'next': next_cursor,
+            'results': RankedLeaderboardEntrySerializer(entries, many=True).data,
+        })
+
+    @action(detail=False, methods=['get'], url_path='window/(?P<window>[a-z]+)')
+    def window(self, request, window=None):
+        """Daily/weekly/monthly leaderboard page: ?after=<cursor>&limit=<n>"""
+        if window not in LEADERBOARD_WINDOWS:
+            raise Http404("Unknown leaderboard window")
+        period, _ = LEADERBOARD_WINDOWS[window]
+        entries, next_cursor = get_window_page(
+            period,
+            request.query_params.get('after'),
+            request.query_params.get('limit', LEADERBOARD_PAGE_SIZE),
+        )
+        return Response({
+            'window': window,
+            'period_start': period_start(period),
+            'next': next_cursor,
+            'results': RankedLeaderboardEntrySerializer(entries, many=True).data,
+        })
+
+    @action(detail=False, methods=['get'], url_path=r'course/(?P<course_id>\d+)')
+    def course(self, request, course_id=None):
+        """Per-course leaderboard page: ?after=<cursor>&limit=<n>"""
+        get_object_or_404(Course.objects.only('id'), pk=course_id)
+        return self._cohort_response(request, course_cohort(course_id))
+
+    @action(detail=False, methods=['get'], url_path='level/(?P<level>[A-Za-z]+)')
+    def level(self, request, level=None):
+        """Per-level leaderboard page: ?after=<cursor>&limit=<n>"""
+        if level not in dict(Course._meta.get_field('level').choices):
+            raise Http404("Unknown course level")
+        return self._cohort_response(request, level_cohort(level))
+
+    def _cohort_response(self, request, cohort):
+        entries, next_cursor = get_cohort_page(
+            cohort,
+            request.query_params.get('after'),
+            request.query_params.get('limit', LEADERBOARD_PAGE_SIZE),
+        )
+        return Response({
+            'cohort': cohort,
+            'next': next_cursor,
+            'results': RankedLeaderboardEntrySerializer(entries, many=True).data,
+        })
+
+    @action(detail=False, methods=['get'], url_path='around-me',
+            permission_classes=[IsAuthenticated])
+    def around_me(self, request):
+        """Entries above and below the current user: ?k=<n>"""
+        k = clamp_page_size(request.query_params.get('k', AROUND_ME_SIZE))
+        entries = get_neighbors(request.user.username, k)
+        return Response({
+            'rank': get_rank(request.user.username),
+            'results': RankedLeaderboardEntrySerializer(entries, many=True).data,
+        })
+
+
+@staff_member_required
+def cache_stats(request):
+    """Per-process cache tier counters (only reported by the two-tier backend)"""
+    backend = caches['default']
+    stats = backend.stats() if hasattr(backend, 'stats') else {}
+    return JsonResponse({'backend': type(backend).__name__, 'stats': stats})
+
+
+@staff_member_required
+def export_data(request, name):
+    """
+    Stream a full table export: ?format=ndjson|csv&since_id=<id>&since=<ISO timestamp>
+
+    Memory use stays flat at any size; pass the last exported id as
+    since_id for incremental pulls.
+    """
+    export_format = request.GET.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return HttpResponseBadRequest(f"Unknown format '{export_format}'")
+    since_id = request.GET.get('since_id')
+    since = request.GET.get('since')
+    try:
+        since_id = int(since_id) if since_id else None
+        since = parse_datetime(since) if since else None
+    except ValueError:
+        return HttpResponseBadRequest("Invalid since_id or since")
+    if request.GET.get('since') and since is None:
+        return HttpResponseBadRequest("Invalid since")
+
+    try:
+        columns, rows = export_rows(name, since_id=since_id, since=since)
+    except ValueError as e:
+        if name not in EXPORTS:
+            raise Http404(str(e))
+        return HttpResponseBadRequest(str(e))
+
+    content_type = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    response = StreamingHttpResponse(render_export(export_format, columns, rows), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{name}.{export_format}"'
+    return response
 
 
 # View to show when user is not signed in
 def not_signed_in(request):
     return render(request, 'not_signed_in.html')
-
-
-def update_leaderboard_entry(player_profile):
-    """Update or create leaderboard entry for a player profile"""
-    if player_profile.points > 0:
-        entry, created = LeaderboardEntry.objects.get_or_create(
-            name=player_profile.user.username,
-            defaults={'score': 0}
-        )
-        # Update score to match current points
-        if entry.score != player_profile.points:
-            entry.score = player_profile.points
-            entry.save()
-
-
-def sync_leaderboard():
-    """Sync leaderboard entries with current PlayerProfile data"""
-    for profile in PlayerProfile.objects.all():
-        if profile.points > 0:  # Only include users with points
-            entry, created = LeaderboardEntry.objects.get_or_create(
-                name=profile.user.username,
-                defaults={'score': 0}
-            )
-            # Update score to match current points
-            if entry.score != profile.points:
-                entry.score = profile.points
-                entry.save()
-    
-    # Remove entries for users who no longer exist or have 0 points
-    LeaderboardEntry.objects.exclude(
-        name__in=PlayerProfile.objects.filter(points__gt=0).values_list('user__username', flat=True)
-    ).delete()